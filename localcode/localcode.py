@@ -2063,6 +2063,10 @@ def cmd_clear() -> None:
         freed = result.get("memory_freed_mb", 0)
         print(f"{GREEN}✓{RESET} Server cache cleared ({freed}MB freed)")
     FILE_VERSIONS.clear()
+    _tool_state._LINE_COUNTS.clear()
+    _tool_state._WRITTEN_STATS.clear()
+    _tool_state._DIGEST_CACHE.clear()
+    _tool_state._SPEC_SEARCH_RESULTS.clear()
     _reset_noop_tracking()
     print(f"{GREEN}✓{RESET} Local file cache cleared")
 
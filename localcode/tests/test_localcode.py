@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """Tests for localcode."""
 
+import contextlib
 import json
 import os
 import re
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -20,6 +22,19 @@ agent = importlib.import_module("localcode")
 # invoked by `module.X = val` — PEP 562 only supports __getattr__/__dir__).
 _inner = importlib.import_module("localcode.localcode")
 _hooks = importlib.import_module("localcode.hooks")
+_tool_state = importlib.import_module("localcode.tool_handlers._state")
+
+
+@contextlib.contextmanager
+def _flag_env(values):
+    """patch.dict(os.environ, values) that also drops the cached LOCALCODE_* flags."""
+    from localcode.tool_handlers.write_handlers import _refresh_flags
+    try:
+        with patch.dict(os.environ, values):
+            _refresh_flags()
+            yield
+    finally:
+        _refresh_flags()
 
 
 class TestNormalizeArgs(unittest.TestCase):
@@ -97,6 +112,18 @@ class TestReadTool(unittest.TestCase):
         result = agent.read("not a dict")
         self.assertIn("invalid arguments", result.lower())
 
+    def test_read_translates_crlf_like_text_mode(self):
+        path = os.path.join(self.temp_dir, "crlf.txt")
+        with open(path, "wb") as f:
+            f.write(b"one\r\ntwo\rthree\n")
+        agent.read({"path": path})
+        self.assertEqual(agent.FILE_VERSIONS[path], "one\ntwo\nthree\n")
+
+    def test_read_fd_bytes_stops_at_limit(self):
+        from localcode.tool_handlers import _state
+        self.assertEqual(_state._read_fd_bytes(self.test_file, 4), b"line")
+        self.assertEqual(_state._read_fd_bytes(self.test_file, 1000), b"line 1\nline 2\nline 3\n")
+
     def test_read_diff_with_line_range(self):
         result = agent.read({"path": self.test_file, "diff": True, "line_start": 1})
         self.assertIn("diff cannot be combined", result.lower())
@@ -181,13 +208,28 @@ class TestWriteTool(unittest.TestCase):
         self.assertIn("ok", result.lower())
         self.assertTrue(os.path.exists(path))
 
+    def test_write_new_file_skips_exists_probe(self):
+        path = os.path.join(self.temp_dir, "fresh.txt")
+        with patch("os.path.exists", side_effect=AssertionError("exists() probe")):
+            result = agent.write({"path": path, "content": "a\n"})
+            again = agent.write({"path": path, "content": "b\n"})
+        self.assertTrue(result.startswith("ok: created"), result)
+        self.assertTrue(again.startswith("ok: updated"), again)
+
+    def test_write_atomic_creates_directories(self):
+        path = os.path.join(self.temp_dir, "subdir", "file.txt")
+        with _flag_env({"LOCALCODE_WRITE_ATOMIC": "1"}):
+            result = agent.write({"path": path, "content": "nested"})
+        self.assertTrue(result.startswith("ok: created"), result)
+        with open(path) as f:
+            self.assertEqual(f.read(), "nested")
+
     def test_write_verbose_can_drop_selected_fields(self):
         path = os.path.join(self.temp_dir, "drop-fields.txt")
         with open(path, "w", encoding="utf-8") as f:
             f.write("old\n")
         _ = agent.read({"path": path})
-        with patch.dict(
-            os.environ,
+        with _flag_env(
             {
                 "LOCALCODE_WRITE_VERBOSE_STATE": "1",
                 "LOCALCODE_WRITE_FULL_DROP": "state_json,state_brief,changed_symbols",
@@ -206,12 +248,10 @@ class TestWriteTool(unittest.TestCase):
         with open(path, "w", encoding="utf-8") as f:
             f.write("old\n")
         _ = agent.read({"path": path})
-        with patch.dict(
-            os.environ,
+        with _flag_env(
             {
                 "LOCALCODE_WRITE_VERBOSE_STATE": "1",
             },
-            clear=False,
         ):
             result = agent.write({"path": path, "content": "new\n"})
         self.assertIn("file_state:", result)
@@ -223,8 +263,7 @@ class TestWriteTool(unittest.TestCase):
         with open(path, "w", encoding="utf-8") as f:
             f.write("old\n")
         _ = agent.read({"path": path})
-        with patch.dict(
-            os.environ,
+        with _flag_env(
             {
                 "LOCALCODE_WRITE_VERBOSE_STATE": "1",
                 "LOCALCODE_WRITE_FULL_DROP": "none",
@@ -233,6 +272,24 @@ class TestWriteTool(unittest.TestCase):
             result = agent.write({"path": path, "content": "new\n"})
         self.assertIn("state_json:", result)
 
+    def test_write_verbose_skips_dropped_summary(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "lazy-summary.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("old\n")
+        _ = agent.read({"path": path})
+        with _flag_env(
+            {
+                "LOCALCODE_WRITE_VERBOSE_STATE": "1",
+                "LOCALCODE_WRITE_FULL_DROP": "change_summary",
+            },
+        ), patch.object(write_handlers, "_change_summary") as summary_mock, \
+                patch.object(write_handlers, "_diff_bundle", wraps=write_handlers._diff_bundle) as diff_mock:
+            result = agent.write({"path": path, "content": "new\n"})
+        summary_mock.assert_not_called()
+        self.assertEqual(diff_mock.call_count, 1)
+        self.assertIn("changed_lines_preview:", result)
+
 
 class TestWriteReadPrecondition(unittest.TestCase):
     """Test optional read-before-write guard for benchmark stability."""
@@ -253,7 +310,7 @@ class TestWriteReadPrecondition(unittest.TestCase):
         agent.FILE_VERSIONS.clear()
 
     def test_write_requires_source_and_spec_reads_when_enabled(self):
-        with patch.dict(os.environ, {"LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1"}):
+        with _flag_env({"LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1"}):
             first = agent.write({"path": self.src, "content": "export const x = 1;\n"})
             self.assertIn("requires reading current file first", first)
 
@@ -269,7 +326,7 @@ class TestWriteReadPrecondition(unittest.TestCase):
         no_spec_src = os.path.join(self.temp_dir, "plain.js")
         with open(no_spec_src, "w", encoding="utf-8") as f:
             f.write("// plain\n")
-        with patch.dict(os.environ, {"LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1"}):
+        with _flag_env({"LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1"}):
             first = agent.write({"path": no_spec_src, "content": "export const y = 2;\n"})
             self.assertIn("requires reading current file first", first)
             _ = agent.read({"path": no_spec_src})
@@ -300,8 +357,7 @@ class TestWriteSpecFocus(unittest.TestCase):
         agent.FILE_VERSIONS.clear()
 
     def test_write_includes_spec_focus_when_enabled(self):
-        with patch.dict(
-            os.environ,
+        with _flag_env(
             {
                 "LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1",
                 "LOCALCODE_WRITE_SPEC_FOCUS": "1",
@@ -339,8 +395,7 @@ class TestWriteSpecContract(unittest.TestCase):
         agent.FILE_VERSIONS.clear()
 
     def test_write_includes_spec_contract_with_missing_method(self):
-        with patch.dict(
-            os.environ,
+        with _flag_env(
             {
                 "LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1",
                 "LOCALCODE_WRITE_SPEC_CONTRACT": "1",
@@ -357,6 +412,153 @@ class TestWriteSpecContract(unittest.TestCase):
         payload = json.loads(contract_line.split("spec_contract: ", 1)[1])
         self.assertEqual(payload.get("missing_functions"), [])
 
+    def test_write_looks_up_companion_specs_once(self):
+        from localcode.tool_handlers import write_handlers
+        with _flag_env(
+            {
+                "LOCALCODE_ENFORCE_READ_BEFORE_WRITE": "1",
+                "LOCALCODE_WRITE_SPEC_FOCUS": "1",
+                "LOCALCODE_WRITE_SPEC_CONTRACT": "1",
+            },
+        ):
+            _ = agent.read({"path": self.src})
+            _ = agent.read({"path": self.spec})
+            with patch.object(
+                write_handlers, "_companion_spec_paths", wraps=write_handlers._companion_spec_paths
+            ) as lookup:
+                out = agent.write({"path": self.src, "content": "export class Contract {}\n// v2\n"})
+        self.assertIn("spec_contract:", out)
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_spec_contract_reuses_api_until_spec_changes(self):
+        from localcode.tool_handlers import write_handlers
+        write_handlers._SPEC_API_CACHE.clear()
+        src = "export class Contract {}\n"
+        first = write_handlers._spec_contract_hint(self.src, src)
+        with patch.object(write_handlers, "_extract_spec_called_api") as extract:
+            self.assertEqual(write_handlers._spec_contract_hint(self.src, src), first)
+        extract.assert_not_called()
+        with open(self.spec, "a", encoding="utf-8") as f:
+            f.write("test('calls baz', () => { new Contract().baz(); });\n")
+        self.assertIn("baz", write_handlers._spec_contract_hint(self.src, src))
+
+    def test_spec_api_patterns_match_declarations(self):
+        from localcode.tool_handlers.write_handlers import _spec_api_patterns
+        method_re, function_re = _spec_api_patterns(("get", "getAll"), ("make", "Shape", "run"))
+        src = "class Shape {}\nexport const make = () => 1;\nthis.getAll (x);\n"
+        self.assertEqual({m.group(1) for m in method_re.finditer(src)}, {"getAll"})
+        self.assertEqual({m.group(m.lastindex) for m in function_re.finditer(src)}, {"Shape", "make"})
+        self.assertEqual(_spec_api_patterns((), ()), (None, None))
+
+    def test_extract_spec_called_api_single_pass(self):
+        from localcode.tool_handlers.write_handlers import _extract_spec_called_api
+        spec = (
+            "const c = new Contract(1).run(make(1));\n"
+            "Contract.reset();\n"
+            "expect(make(2)).toBe(helper(3));\n"
+            "obj.helper(4);\n"
+        )
+        methods, functions = _extract_spec_called_api(spec, ["Contract", "make", "helper"])
+        self.assertEqual(methods, ["run", "reset"])
+        self.assertEqual(functions, ["make", "helper"])
+
+
+class TestFindAndReadSpec(unittest.TestCase):
+    """Spec injection search used by LOCALCODE_INJECT_TESTS_ON_WRITE."""
+
+    def setUp(self):
+        from localcode.tool_handlers import write_handlers
+        self.temp_dir = tempfile.mkdtemp()
+        _inner.SANDBOX_ROOT = self.temp_dir
+        agent.FILE_VERSIONS.clear()
+        write_handlers._SPEC_SEARCH_RESULTS.clear()
+
+    def tearDown(self):
+        _inner.SANDBOX_ROOT = None
+        agent.FILE_VERSIONS.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_skips_ignored_dirs(self):
+        from localcode.tool_handlers import write_handlers
+        os.makedirs(os.path.join(self.temp_dir, "node_modules", "dep"))
+        os.makedirs(os.path.join(self.temp_dir, "src"))
+        with open(os.path.join(self.temp_dir, "node_modules", "dep", "dep.spec.js"), "w") as f:
+            f.write("test('dep', () => {});\n")
+        with open(os.path.join(self.temp_dir, "src", "app.spec.js"), "w") as f:
+            f.write("test('app', () => {});\n")
+        out = write_handlers._find_and_read_spec()
+        self.assertIn("app.spec.js", out)
+        self.assertNotIn("dep.spec.js", out)
+
+    def test_spec_only_under_ignored_dir_is_not_injected(self):
+        from localcode.tool_handlers import write_handlers
+        os.makedirs(os.path.join(self.temp_dir, "node_modules", "dep"))
+        with open(os.path.join(self.temp_dir, "node_modules", "dep", "dep.spec.js"), "w") as f:
+            f.write("test('dep', () => {});\n")
+        self.assertEqual(write_handlers._find_and_read_spec(), "")
+
+    def test_symlinks_are_classified_like_os_walk(self):
+        from localcode.tool_handlers import write_handlers
+        real = os.path.join(self.temp_dir, "real")
+        os.makedirs(real)
+        os.symlink(real, os.path.join(self.temp_dir, "dir.spec.js"))
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        with open(os.path.join(other, "out.spec.js"), "w") as f:
+            f.write("test('out', () => {});\n")
+        os.symlink(other, os.path.join(self.temp_dir, "linked"))
+        self.assertIsNone(write_handlers._first_spec_file(self.temp_dir))
+
+    def test_miss_is_cached_until_root_changes(self):
+        from localcode.tool_handlers import write_handlers
+        self.assertEqual(write_handlers._find_and_read_spec(), "")
+        with patch.object(write_handlers, "_first_spec_file") as search:
+            self.assertEqual(write_handlers._find_and_read_spec(), "")
+        search.assert_not_called()
+        with open(os.path.join(self.temp_dir, "late.test.js"), "w") as f:
+            f.write("test('late', () => {});\n")
+        os.utime(self.temp_dir, ns=(0, os.stat(self.temp_dir).st_mtime_ns + 1_000_000_000))
+        self.assertIn("late.test.js", write_handlers._find_and_read_spec())
+
+    def test_large_spec_is_capped_on_a_line_boundary(self):
+        from localcode.tool_handlers import write_handlers
+        with open(os.path.join(self.temp_dir, "app.spec.js"), "w") as f:
+            f.write("test(1);\ntest(2);\ntest(3);\n")
+        with patch.object(write_handlers, "_INLINE_CONTENT_MAX_CHARS", 20):
+            out = write_handlers._find_and_read_spec()
+        self.assertIn("   1| test(1);\n   2| test(2);\n...[truncated 9 chars; read app.spec.js", out)
+        self.assertNotIn("test(3)", out)
+
+    def test_nested_spec_found_after_mutation_or_shell(self):
+        from localcode.tool_handlers import _state, write_handlers
+        tests_dir = os.path.join(self.temp_dir, "tests")
+        os.makedirs(tests_dir)
+        self.assertEqual(write_handlers._find_and_read_spec(), "")
+        # A file created in a subdirectory leaves the root's mtime alone.
+        with open(os.path.join(tests_dir, "foo.test.js"), "w") as f:
+            f.write("test('foo', () => {});\n")
+        self.assertEqual(write_handlers._find_and_read_spec(), "")
+        _state._next_mutation_id()
+        self.assertIn("foo.test.js", write_handlers._find_and_read_spec())
+        agent.FILE_VERSIONS.clear()
+        os.remove(os.path.join(tests_dir, "foo.test.js"))
+        agent.shell({"command": "true", "workdir": self.temp_dir, "timeout_ms": 5000})
+        with patch.object(write_handlers, "_first_spec_file", return_value=None) as search:
+            self.assertEqual(write_handlers._find_and_read_spec(), "")
+        search.assert_called_once()
+
+    def test_hit_is_reinjected_without_walking(self):
+        from localcode.tool_handlers import write_handlers
+        with open(os.path.join(self.temp_dir, "app.spec.js"), "w") as f:
+            f.write("test('app', () => {});\n")
+        self.assertIn("app.spec.js", write_handlers._find_and_read_spec())
+        self.assertEqual(write_handlers._find_and_read_spec(), "")
+        agent.FILE_VERSIONS.clear()
+        with patch.object(write_handlers, "_first_spec_file") as search:
+            self.assertIn("app.spec.js", write_handlers._find_and_read_spec())
+        search.assert_not_called()
+
+
 class TestPathAutocorrectScope(unittest.TestCase):
     """Path autocorrect should stay in current task scope by default."""
 
@@ -405,6 +607,35 @@ class TestPathAutocorrectScope(unittest.TestCase):
         result = agent.read({"path": "nested/does-not-exist/local.txt"})
         self.assertIn("local content", result)
 
+    def test_autocorrect_miss_is_cached_until_a_mutation(self):
+        from localcode.tool_handlers import _path
+        sub = os.path.join(self.task_a, "sub")
+        os.makedirs(sub)
+        os.chdir(self.task_a)
+        with patch.object(_path.os, "walk", wraps=os.walk) as walk_mock:
+            self.assertIsNone(_path._find_file_in_sandbox("late.txt"))
+            self.assertIsNone(_path._find_file_in_sandbox("late.txt"))
+            self.assertEqual(walk_mock.call_count, 1)
+            agent.write({"path": os.path.join(sub, "late.txt"), "content": "x\n"})
+            found = _path._find_file_in_sandbox("late.txt")
+            self.assertEqual(walk_mock.call_count, 2)
+        self.assertEqual(found, os.path.join(os.path.realpath(sub), "late.txt"))
+
+    def test_autocorrect_cache_is_not_reused_after_session_reset(self):
+        from localcode.tool_handlers import _path, _state
+        sub = os.path.join(self.task_a, "sub")
+        os.makedirs(sub)
+        os.chdir(self.task_a)
+        _state._reset_noop_tracking()
+        self.assertIsNone(_path._find_file_in_sandbox("again.txt"))
+        agent.write({"path": os.path.join(sub, "again.txt"), "content": "x\n"})
+        # The reset rewinds MUTATION_SEQ to the value the cached miss saw.
+        _state._reset_noop_tracking()
+        self.assertEqual(
+            _path._find_file_in_sandbox("again.txt"),
+            os.path.join(os.path.realpath(sub), "again.txt"),
+        )
+
 
 class TestDisplayPathNormalization(unittest.TestCase):
     """Ensure tool outputs show sandbox-relative paths, not absolute paths."""
@@ -492,6 +723,125 @@ class TestEditTool(unittest.TestCase):
         with open(self.test_file) as f:
             self.assertIn("goodbye", f.read())
 
+    def test_edit_snippet_reuses_diff_bundle(self):
+        from localcode.tool_handlers import write_handlers
+        with patch.object(write_handlers, "_diff_bundle", wraps=write_handlers._diff_bundle) as diff_mock:
+            result = agent.edit({"path": self.test_file, "old": "foo", "new": "baz"})
+        self.assertEqual(diff_mock.call_count, 1)
+        self.assertIn("Showing lines 1-2 of 2:", result)
+
+    def test_js_edit_skips_parse_of_own_checked_write(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "mod.js")
+        with open(path, "w") as f:
+            f.write("const a = 1;\n")
+        parsed = []
+
+        def check(*sources):
+            parsed.extend(sources)
+            return (True,) * len(sources)
+
+        with patch.object(write_handlers, "_js_syntax_check", side_effect=check) as check_mock:
+            agent.edit({"path": path, "old": "a = 1", "new": "a = 2"})
+            self.assertEqual((check_mock.call_count, len(parsed)), (1, 2))
+            agent.edit({"path": path, "old": "a = 2", "new": "a = 3"})
+            self.assertEqual((check_mock.call_count, len(parsed)), (2, 3))
+            with open(path, "w") as f:
+                f.write("const a = 4;\n")
+            agent.edit({"path": path, "old": "a = 4", "new": "a = 5"})
+            self.assertEqual((check_mock.call_count, len(parsed)), (3, 5))
+
+    def test_edit_error_caps_inlined_content(self):
+        from localcode.tool_handlers import write_handlers
+        with patch.object(write_handlers, "_INLINE_CONTENT_MAX_CHARS", 8):
+            missing = agent.edit({"path": self.test_file, "old": "hello"})
+            not_found = agent.edit({"path": self.test_file, "old": "nope", "new": "x"})
+        for result in (missing, not_found):
+            self.assertIn("hello wo\n...[truncated 12 chars", result)
+            self.assertNotIn("foo bar", result)
+
+    def test_edit_error_centers_capped_content_on_old(self):
+        from localcode.tool_handlers import write_handlers
+        with open(self.test_file, "w") as f:
+            f.write("".join(f"line{i:02d}\n" for i in range(10)))
+        with patch.object(write_handlers, "_INLINE_CONTENT_MAX_CHARS", 21):
+            result = agent.edit({"path": self.test_file, "old": "\nline07\nnope", "new": "x"})
+        self.assertIn("...[truncated 42 chars]...\nline06\nline07\nline08\n\n...[truncated 7 chars", result)
+        self.assertNotIn("line05", result)
+
+    def test_real_edit_resets_noop_streak(self):
+        args = {"path": self.test_file, "old": "hello", "new": "hello"}
+        agent.edit(args)
+        agent.edit(args)
+        counts = agent._NOOP_COUNTS[self.test_file]
+        self.assertEqual(counts.edit_noop, 2)
+        agent.edit({"path": self.test_file, "old": "hello", "new": "bye"})
+        self.assertEqual((counts.edit_noop, counts.edit_real), (0, 1))
+        first = agent.edit({"path": self.test_file, "old": "bye", "new": "bye"})
+        self.assertIn("old equals new", first)
+
+    def test_noop_edit_digest_cached_until_file_changes(self):
+        from localcode.tool_handlers import write_handlers
+        args = {"path": self.test_file, "old": "hello", "new": "hello"}
+        with patch.object(write_handlers, "_bytes_digest", wraps=write_handlers._bytes_digest) as digest_mock:
+            first = agent.edit(args)
+            second = agent.edit(args)
+            self.assertEqual(digest_mock.call_count, 1)
+            with open(self.test_file, "w") as f:
+                f.write("changed outside\n")
+            agent.edit(args)
+            self.assertEqual(digest_mock.call_count, 2)
+        sha = re.search(r'"before_sha":\s*"(\w+)"', first)
+        self.assertIsNotNone(sha, first)
+        self.assertIn(sha.group(1), second)
+        self.assertEqual(sha.group(1), write_handlers._content_digest("hello world\nfoo bar\n"))
+
+    def test_noop_edit_digest_of_crlf_file_matches_text(self):
+        from localcode.tool_handlers import write_handlers
+        with open(self.test_file, "wb") as f:
+            f.write(b"hello\r\nworld\r\n")
+        result = agent.edit({"path": self.test_file, "old": "hello", "new": "hello"})
+        self.assertIn(write_handlers._content_digest("hello\nworld\n"), result)
+
+    def test_current_file_sha_unknown_for_non_utf8_file(self):
+        from localcode.tool_handlers import write_handlers
+        with open(self.test_file, "wb") as f:
+            f.write(b"caf\xe9\n")
+        self.assertEqual(write_handlers._current_file_sha(self.test_file), "unknown")
+
+    def test_edit_ambiguous_old_reports_full_count(self):
+        with open(self.test_file, "w") as f:
+            f.write("x\nx\nx\n")
+        result = agent.edit({"path": self.test_file, "old": "x", "new": "y"})
+        self.assertIn("appears 3 times", result)
+
+    def test_edit_exact_unique_hit_skips_fuzzy_resolution(self):
+        from localcode.tool_handlers import write_handlers
+        with patch.object(write_handlers, "_resolve_old_text") as resolve_mock:
+            result = agent.edit({"path": self.test_file, "old": "foo", "new": "baz"})
+        resolve_mock.assert_not_called()
+        self.assertTrue(result.startswith("ok:"), result)
+        with open(self.test_file) as f:
+            self.assertEqual(f.read(), "hello world\nbaz bar\n")
+
+    def test_edit_all_replaces_every_occurrence(self):
+        with open(self.test_file, "w") as f:
+            f.write("x\nx\nx\n")
+        result = agent.edit({"path": self.test_file, "old": "x", "new": "y", "all": True})
+        self.assertIn("3 replacement(s)", result)
+        with open(self.test_file) as f:
+            self.assertEqual(f.read(), "y\ny\ny\n")
+
+    def test_edit_all_counts_replacements_from_length_change(self):
+        with open(self.test_file, "w") as f:
+            f.write("x\nx\nx\n")
+        result = agent.edit({"path": self.test_file, "old": "x", "new": "yy", "all": True})
+        self.assertIn("3 replacement(s)", result)
+        result = agent.edit({"path": self.test_file, "old": "yy\n", "new": "", "all": True})
+        self.assertIn("3 replacement(s)", result)
+        with open(self.test_file) as f:
+            self.assertEqual(f.read(), "")
+
     def test_edit_not_found(self):
         result = agent.edit({
             "path": self.test_file,
@@ -529,6 +879,39 @@ class TestEditTool(unittest.TestCase):
         with open(path, encoding="utf-8") as f:
             self.assertIn('"bye"', f.read())
 
+    def test_resolve_old_text_normalizes_haystack_once(self):
+        from localcode.tool_handlers import write_handlers
+        text = "alpha\n\u201cbeta\u201d\ngamma\n"
+        real = write_handlers._normalize_unicode_for_match
+        with patch.object(write_handlers, "_normalize_unicode_for_match", side_effect=real) as norm:
+            self.assertIsNone(write_handlers._resolve_old_text(text, "missing\n"))
+        self.assertEqual([c.args[0] for c in norm.call_args_list].count(text), 1)
+
+    def test_unicode_slice_uniqueness(self):
+        from localcode.tool_handlers.write_handlers import _find_unique_unicode_slice
+        self.assertEqual(_find_unique_unicode_slice("a \u201cb\u201d c", '"b"'), "\u201cb\u201d")
+        self.assertIsNone(_find_unique_unicode_slice("\u201cb\u201d \u201cb\u201d", '"b"'))
+        self.assertIsNone(_find_unique_unicode_slice("plain", '"b"'))
+
+    def test_resolve_old_text_ascii_skips_unicode_passes(self):
+        from localcode.tool_handlers import write_handlers
+        text = "alpha\nbeta  \ngamma\n"
+        with patch.object(write_handlers, "_normalize_unicode_for_match") as norm:
+            self.assertIsNone(write_handlers._resolve_old_text(text, "missing\n"))
+            self.assertEqual(write_handlers._resolve_old_text(text, "beta\n"), "beta  \n")
+        norm.assert_not_called()
+        # An ASCII needle can still match curly quotes in a non-ASCII file.
+        self.assertEqual(
+            write_handlers._resolve_old_text('say \u201chi\u201d\n', 'say "hi"'),
+            'say \u201chi\u201d',
+        )
+
+    def test_line_window_slice_keeps_original_line_endings(self):
+        from localcode.tool_handlers.write_handlers import _find_unique_line_window_slice, _line_rstrip
+        text = "one\r\ntwo  \r\nthree\r\n"
+        self.assertEqual(_find_unique_line_window_slice(text, "two\nthree\n", _line_rstrip), "two  \r\nthree\r\n")
+        self.assertEqual(_find_unique_line_window_slice(text, "one\ntwo", _line_rstrip), "one\r\ntwo  ")
+
     def test_edit_relaxed_trim_end_match(self):
         path = os.path.join(self.temp_dir, "trim.txt")
         with open(path, "w", encoding="utf-8") as f:
@@ -562,6 +945,18 @@ class TestEditTool(unittest.TestCase):
             content = f.read()
         self.assertEqual(content, "one\nupdated-middle\nthree\n")
 
+    def test_edit_identical_result_rejected(self):
+        path = os.path.join(self.temp_dir, "same.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("say 'hi'\nmiddle\n")
+        # The curly quotes resolve to the file's straight quotes, which equal new.
+        result = agent.edit({"path": path, "old": "say \u2018hi\u2019", "new": "say 'hi'"})
+        self.assertIn("identical result", result)
+        read_out = agent.read({"path": path, "format": "hashline"})
+        line_ref = read_out.splitlines()[1].split("|", 1)[0]
+        result = agent.edit({"path": path, "old_start": line_ref, "new": "middle\n"})
+        self.assertIn("identical result", result)
+
     def test_edit_hashline_anchor_mismatch(self):
         path = os.path.join(self.temp_dir, "anchor-mismatch.txt")
         with open(path, "w", encoding="utf-8") as f:
@@ -582,6 +977,37 @@ class TestEditTool(unittest.TestCase):
         self.assertIn("old_end requires old_start", result.lower())
 
 
+@unittest.skipUnless(shutil.which("node"), "node is not installed")
+class TestJsSyntaxCheck(unittest.TestCase):
+    """Persistent node syntax checker used by the edit syntax guard."""
+
+    def test_checks_module_syntax_with_one_process(self):
+        from localcode.tool_handlers import write_handlers
+        self.assertTrue(write_handlers._js_syntax_ok("export const x = await 1;\n"))
+        proc = write_handlers._NODE_CHECKER
+        self.assertFalse(write_handlers._js_syntax_ok("const x = ;\n"))
+        self.assertTrue(write_handlers._js_syntax_ok("import fs from 'fs';\nexport default fs;\n"))
+        self.assertIs(write_handlers._NODE_CHECKER, proc)
+
+    def test_accepts_encoded_source(self):
+        from localcode.tool_handlers import write_handlers
+        self.assertTrue(write_handlers._js_syntax_ok("const s = 'caf\u00e9';\n".encode("utf-8")))
+        self.assertFalse(write_handlers._js_syntax_ok(b"const x = ;\n"))
+
+    def test_checks_several_sources_in_one_round_trip(self):
+        from localcode.tool_handlers import write_handlers
+        self.assertEqual(
+            write_handlers._js_syntax_check("let a = 1;\n", b"let = ;\n", "export {};\n"),
+            (True, False, True),
+        )
+
+    def test_restarts_after_checker_exit(self):
+        from localcode.tool_handlers import write_handlers
+        write_handlers._js_syntax_ok("let a = 1;\n")
+        write_handlers._stop_node_checker()
+        self.assertFalse(write_handlers._js_syntax_ok("let a = 1; let a = 2;\n"))
+
+
 class TestFinishTool(unittest.TestCase):
     """Test finish tool behavior."""
 
@@ -657,6 +1083,35 @@ class TestShellTool(unittest.TestCase):
         self.assertIn("error", result.lower())
         self.assertIn("test", result.lower())
 
+    def test_shell_large_output_keeps_head_and_tail(self):
+        target = os.path.join(self.temp_dir, "big.txt")
+        with open(target, "w") as f:
+            f.write("HEAD\n" + "x" * 1_000_000 + "\nTAIL\n")
+        payload = json.loads(agent.shell({
+            "command": "cat big.txt",
+            "workdir": self.temp_dir,
+            "timeout_ms": 5000
+        }))
+        output = payload["output"]
+        self.assertTrue(output.startswith("HEAD\n"))
+        self.assertTrue(output.endswith("\nTAIL"))
+        self.assertIn("[truncated 970010 chars]", output)
+        self.assertEqual(payload["metadata"]["exit_code"], 0)
+
+    @unittest.skipUnless(
+        "utf" in __import__("locale").getpreferredencoding(False).lower(), "needs a UTF-8 locale"
+    )
+    def test_shell_large_non_ascii_output_counts_chars(self):
+        target = os.path.join(self.temp_dir, "big.txt")
+        with open(target, "w", encoding="utf-8") as f:
+            f.write("HEAD\n" + "é" * 1_000_000 + "\nTAIL\n")
+        payload = json.loads(agent.shell({
+            "command": "cat big.txt",
+            "workdir": self.temp_dir,
+            "timeout_ms": 5000
+        }))
+        self.assertIn("[truncated 970010 chars]", payload["output"])
+
     def test_shell_blocks_dangerous_commands(self):
         result = agent.shell({
             "command": "rm -rf /",
@@ -827,6 +1282,14 @@ class TestGlobTool(unittest.TestCase):
         self.assertIn("test1.py", result)
         self.assertIn("readme.md", result)
 
+    def test_glob_fallback_lists_newest_first(self):
+        from localcode.tool_handlers import search_handlers
+        os.utime(os.path.join(self.temp_dir, "test1.py"), (1000, 1000))
+        os.utime(os.path.join(self.temp_dir, "test2.py"), (2000, 2000))
+        with patch.object(search_handlers, "_RG_PATH", None):
+            result = agent.glob_fn({"pat": "*.py", "path": self.temp_dir})
+        self.assertEqual(result.splitlines(), ["test2.py", "test1.py"])
+
     def test_glob_invalid_args_type(self):
         result = agent.glob_fn("not a dict")
         self.assertIn("invalid arguments", result.lower())
@@ -853,6 +1316,68 @@ class TestGrepTool(unittest.TestCase):
         result = agent.grep_fn({"pat": "nonexistent", "path": self.temp_dir})
         self.assertIn("no matches", result.lower())
 
+    def test_grep_include_language_type(self):
+        result = agent.grep_fn({"pat": "def hello", "path": self.temp_dir, "include": "py"})
+        self.assertIn("test.py", result)
+
+    def test_grep_include_bare_file_name(self):
+        with open(os.path.join(self.temp_dir, "Makefile"), "w") as f:
+            f.write("all:\n")
+        result = agent.grep_fn({"pat": "all:", "path": self.temp_dir, "include": "Makefile"})
+        self.assertIn("Makefile:1:all:", result)
+
+    def test_include_globs_map_only_known_languages(self):
+        from localcode.tool_handlers import search_handlers
+        self.assertEqual(search_handlers._include_globs("rs"), ("*.rs",))
+        self.assertEqual(search_handlers._include_globs("Dockerfile"), ("Dockerfile",))
+        self.assertNotIn("--type", search_handlers._rg_filter_args("yml"))
+
+    def test_grep_skips_ignored_dirs(self):
+        os.makedirs(os.path.join(self.temp_dir, "node_modules"))
+        with open(os.path.join(self.temp_dir, "node_modules", "dep.py"), "w") as f:
+            f.write("def hello():\n")
+        result = agent.grep_fn({"pat": "def hello", "path": self.temp_dir})
+        self.assertIn("test.py", result)
+        self.assertNotIn("dep.py", result)
+
+    def test_grep_python_fallback_without_rg(self):
+        from localcode.tool_handlers import search_handlers
+        with patch.object(search_handlers, "_RG_PATH", None):
+            result = agent.grep_fn({"pat": "print\\(", "path": self.temp_dir})
+        self.assertIn("test.py:2:", result)
+
+    def test_grep_python_fallback_clips_long_lines(self):
+        from localcode.tool_handlers import search_handlers
+        with open(os.path.join(self.temp_dir, "long.py"), "w") as f:
+            f.write("needle" + "y" * 500 + "\n")
+        with patch.object(search_handlers, "_RG_PATH", None):
+            result = agent.grep_fn({"pat": "needle", "path": self.temp_dir})
+        line = next(ln for ln in result.splitlines() if ln.startswith("long.py:1:"))
+        self.assertEqual(line, "long.py:1:" + ("needle" + "y" * 144) + search_handlers._RG_LONG_LINE_MARKER)
+
+    def test_refresh_rg_path_follows_path_env(self):
+        from localcode.tool_handlers import search_handlers
+        original = search_handlers._RG_PATH
+        try:
+            with patch.dict(os.environ, {"PATH": self.temp_dir}):
+                self.assertIsNone(search_handlers._refresh_rg_path())
+        finally:
+            search_handlers._RG_PATH = original
+
+    def test_parse_rg_json_match_event(self):
+        from localcode.tool_handlers import search_handlers
+        event = {
+            "type": "match",
+            "data": {
+                "path": {"text": "src/a:b.py"},
+                "lines": {"text": "x = 1\n"},
+                "line_number": 7,
+            },
+        }
+        line = json.dumps(event, separators=(",", ":")).encode() + b"\n"
+        self.assertEqual(search_handlers._parse_json_hit(line), "src/a:b.py:7:x = 1")
+        self.assertIsNone(search_handlers._parse_json_hit(b'{"type":"begin","data":{}}\n'))
+
     def test_grep_missing_pattern(self):
         result = agent.grep_fn({"path": self.temp_dir})
         self.assertIn("error", result.lower())
@@ -887,6 +1412,26 @@ class TestSearchTool(unittest.TestCase):
         result = agent.search_fn({"pattern": "nonexistent", "path": self.temp_dir})
         self.assertIn("no matches", result.lower())
 
+    def test_search_many_files_respects_max_results(self):
+        for i in range(8):
+            with open(os.path.join(self.temp_dir, f"mod{i}.js"), "w") as f:
+                f.write("hello\nhello\n")
+        result = agent.search_fn({"pattern": "hello", "path": self.temp_dir, "max_results": 5})
+        hits = [ln for ln in result.splitlines() if ":" in ln and "truncated" not in ln]
+        self.assertEqual(len(hits), 5)
+        self.assertIn("results are truncated", result)
+
+    def test_fallback_scan_stops_once_limit_reached(self):
+        from localcode.tool_handlers import search_handlers
+        for i in range(200):
+            with open(os.path.join(self.temp_dir, f"mod{i:03d}.js"), "w") as f:
+                f.write("hello\n")
+        with patch.object(search_handlers, "_SCAN_WINDOW", 4), \
+                patch.object(search_handlers, "_scan_file", wraps=search_handlers._scan_file) as scan:
+            hits, _ = search_handlers._fallback_scan(self.temp_dir, "hello", False, None, 5)
+        self.assertEqual(len(hits), 5)
+        self.assertLess(scan.call_count, 20)
+
     def test_search_missing_pattern(self):
         result = agent.search_fn({"path": self.temp_dir})
         self.assertIn("error", result.lower())
@@ -917,6 +1462,13 @@ class TestLsTool(unittest.TestCase):
         self.assertIn("file1.txt", result)
         self.assertIn("subdir", result)
 
+    def test_ls_sees_entries_created_right_after_listing(self):
+        agent.ls_fn({"path": self.temp_dir})
+        with open(os.path.join(self.temp_dir, "file2.txt"), "w") as f:
+            f.write("content")
+        result = agent.ls_fn({"path": self.temp_dir})
+        self.assertIn("file2.txt", result)
+
     def test_ls_nonexistent(self):
         result = agent.ls_fn({"path": "/nonexistent"})
         self.assertIn("error", result.lower())
@@ -941,6 +1493,34 @@ class TestSandboxValidation(unittest.TestCase):
         self.assertTrue(agent._is_path_within_sandbox("/tmp", "/tmp"))
 
 
+class TestIgnoredPath(unittest.TestCase):
+    """Test ignored-directory detection."""
+
+    def test_ignored_component(self):
+        self.assertTrue(agent._is_ignored_path("src/node_modules/pkg/index.js"))
+        self.assertTrue(agent._is_ignored_path("/repo/.git"))
+        self.assertTrue(agent._is_ignored_path("__pycache__"))
+
+    def test_partial_name_not_ignored(self):
+        self.assertFalse(agent._is_ignored_path("src/my_node_modules/a.js"))
+        self.assertFalse(agent._is_ignored_path("repo/.gitignore"))
+
+
+class TestBlockTestEdit(unittest.TestCase):
+    """Test read-only protection of test files."""
+
+    def test_env_override_still_applies_with_cached_path_check(self):
+        from localcode.tool_handlers import _path
+        path = "/repo/tests/test_app.py"
+        with patch.dict(os.environ, {"LOCALCODE_BLOCK_TEST_EDITS": "1"}):
+            self.assertTrue(_path._should_block_test_edit(path))
+            hits = _path._is_test_path.cache_info().hits
+            self.assertTrue(_path._should_block_test_edit(path))
+            self.assertEqual(_path._is_test_path.cache_info().hits, hits + 1)
+        with patch.dict(os.environ, {"LOCALCODE_BLOCK_TEST_EDITS": "0"}):
+            self.assertFalse(_path._should_block_test_edit(path))
+
+
 class TestDangerousCommandDetection(unittest.TestCase):
     """Test dangerous command pattern detection."""
 
@@ -2227,15 +2807,25 @@ class TestNoopDetection(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
 
     def tearDown(self):
         import shutil
         shutil.rmtree(self.temp_dir)
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
         agent.FILE_VERSIONS.clear()
 
+    @staticmethod
+    def _age_written(path):
+        """Move the record time of our last write of *path* past the racy window."""
+        from localcode.tool_handlers import write_handlers
+        sig, text, sha, _ = _tool_state._WRITTEN_STATS[path]
+        recorded = os.stat(path).st_mtime_ns + write_handlers._RACY_WINDOW_NS
+        _tool_state._WRITTEN_STATS[path] = (sig, text, sha, recorded)
+
     def test_write_noop_first_returns_ok(self):
         """First no-op write returns ok with no-change guidance."""
         path = os.path.join(self.temp_dir, "test.txt")
@@ -2258,6 +2848,14 @@ class TestNoopDetection(unittest.TestCase):
         self.assertTrue(result2.startswith("error:"), f"Expected error on second noop, got: {result2}")
         self.assertIn("repeated no-op write", result2.lower())
 
+    def test_write_noop_count_resets_after_real_change(self):
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "hello"})
+        agent.write({"path": path, "content": "hello"})
+        self.assertEqual(_tool_state._NOOP_WRITE_COUNTS[path], 1)
+        agent.write({"path": path, "content": "bye"})
+        self.assertNotIn(path, _tool_state._NOOP_WRITE_COUNTS)
+
     def test_write_new_file_ok(self):
         path = os.path.join(self.temp_dir, "new.txt")
         result = agent.write({"path": path, "content": "hello"})
@@ -2272,6 +2870,270 @@ class TestNoopDetection(unittest.TestCase):
         self.assertTrue(result.startswith("ok:"), f"Expected ok, got: {result}")
         self.assertIn("updated", result)
 
+    def test_write_noop_ignores_crlf_line_endings(self):
+        path = os.path.join(self.temp_dir, "test.txt")
+        with open(path, "wb") as f:
+            f.write(b"a\r\nb\r\n")
+        result = agent.write({"path": path, "content": "a\nb\n"})
+        self.assertIn("no changes", result.lower())
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"a\r\nb\r\n")
+
+    def test_write_bytes_retries_short_writes(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "short.txt")
+        real_write = os.write
+        with patch.object(write_handlers.os, "write", side_effect=lambda fd, buf: real_write(fd, buf[:3])):
+            write_handlers._write_bytes(path, b"0123456789")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"0123456789")
+
+    def test_read_text_translates_newlines_like_text_mode(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "crlf.txt")
+        with open(path, "wb") as f:
+            f.write(b"a\r\nb\rc\n")
+        self.assertEqual(write_handlers._read_text(path), "a\nb\nc\n")
+
+    @unittest.skipUnless(os.path.exists("/proc/self/status"), "needs procfs")
+    def test_read_text_reads_files_reporting_zero_size(self):
+        from localcode.tool_handlers import write_handlers
+        self.assertIn("Name:", write_handlers._read_text("/proc/self/status"))
+
+    def test_write_repeat_noop_skips_reading_file(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "hello\n"})
+        self._age_written(path)
+        with patch.object(write_handlers, "_read_unless_equal") as read_mock:
+            result = agent.write({"path": path, "content": "hello\n"})
+        read_mock.assert_not_called()
+        self.assertIn("no changes", result.lower())
+
+    def test_write_after_own_write_diffs_without_reading(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "hello\n"})
+        self._age_written(path)
+        with patch.object(write_handlers, "_read_unless_equal") as read_mock:
+            result = agent.write({"path": path, "content": "hello\nworld\n"})
+        read_mock.assert_not_called()
+        self.assertIn("+1 -0 lines", result)
+        with open(path) as f:
+            self.assertEqual(f.read(), "hello\nworld\n")
+
+    def test_edit_after_write_reuses_content_and_digest(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        first = agent.write({"path": path, "content": "hello\n"})
+        written_sha = re.search(r"sha256=(\w+)", first).group(1)
+        with patch.object(write_handlers, "_read_text") as read_mock, \
+                patch.object(write_handlers, "_content_digest", wraps=write_handlers._content_digest) as digest_mock:
+            result = agent.edit({"path": path, "old": "hello", "new": "bye"})
+        read_mock.assert_not_called()
+        digest_mock.assert_not_called()
+        self.assertIn(f"prev_sha256={written_sha}", result)
+
+    def test_write_over_changed_file_hashes_disk_bytes(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        with open(path, "w") as f:
+            f.write("old\n")
+        with patch.object(write_handlers, "_content_digest", wraps=write_handlers._content_digest) as digest_mock, \
+                _flag_env({"LOCALCODE_WRITE_VERBOSE_STATE": "1"}):
+            result = agent.write({"path": path, "content": "new\n"})
+        self.assertNotIn(("old\n",), [call.args for call in digest_mock.call_args_list])
+        old_sha = write_handlers._content_digest("old\n")
+        self.assertIn(f"prev_sha256={old_sha}", result)
+
+    def test_write_over_changed_file_counts_disk_newlines(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        with open(path, "w") as f:
+            f.write("\u00e9\n" * 3)
+        with patch.object(write_handlers, "_cached_newline_count") as count_mock:
+            result = agent.write({"path": path, "content": "a\n"})
+        count_mock.assert_not_called()
+        self.assertIn("+0 -2 lines", result)
+        with open(path, "wb") as f:
+            f.write(b"a\r\nb\r\n")
+        self.assertIn("+0 -1 lines", agent.write({"path": path, "content": "c\n"}))
+
+    def test_crlf_write_is_not_remembered(self):
+        from localcode.tool_handlers import _state
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "a\r\nb\r\n"})
+        self.assertNotIn(path, _state._WRITTEN_STATS)
+        result = agent.edit({"path": path, "old": "a\nb", "new": "c\nd"})
+        self.assertTrue(result.startswith("ok: updated"), result)
+
+    def test_write_rereads_file_changed_outside(self):
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "hello\n"})
+        with open(path, "w") as f:
+            f.write("other content\n")
+        result = agent.write({"path": path, "content": "hello\n"})
+        self.assertTrue(result.startswith("ok: updated"), result)
+
+    def test_racy_written_entry_is_checked_against_disk(self):
+        from localcode.tool_handlers import _state, write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "hello\n"})
+        # A same-size rewrite in the same timestamp tick: the stat signature
+        # is unchanged, only the bytes differ.
+        with open(path, "w") as f:
+            f.write("HELLO\n")
+        sig, text, sha, recorded = _state._WRITTEN_STATS[path]
+        _state._WRITTEN_STATS[path] = (_state._stat_signature(os.stat(path)), text, sha, recorded)
+        self.assertIsNone(write_handlers._written_content(path))
+        self.assertNotIn(path, _state._WRITTEN_STATS)
+        result = agent.write({"path": path, "content": "hello\n"})
+        self.assertTrue(result.startswith("ok: updated"), result)
+
+    def test_written_entry_trusts_stat_once_window_passed(self):
+        from localcode.tool_handlers import _state, write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "hello\n"})
+        entry = _state._WRITTEN_STATS[path]
+        mtime_ns = os.stat(path).st_mtime_ns
+        with patch.object(write_handlers.time, "time_ns",
+                          return_value=mtime_ns + write_handlers._RACY_WINDOW_NS):
+            self.assertEqual(write_handlers._written_content(path), "hello\n")
+        self.assertEqual(_state._WRITTEN_STATS[path][3], mtime_ns + write_handlers._RACY_WINDOW_NS)
+        self.assertIs(_state._WRITTEN_STATS[path][1], entry[1])
+        with patch.object(write_handlers, "_read_unless_equal", side_effect=AssertionError):
+            self.assertEqual(write_handlers._written_content(path), "hello\n")
+
+    def test_scratch_buffer_reused_but_not_grown(self):
+        from localcode.tool_handlers import write_handlers
+        small = write_handlers._scratch(10)
+        self.assertIs(write_handlers._scratch(100), small)
+        big = write_handlers._scratch(write_handlers._SCRATCH_SOFT_MAX * 4)
+        self.assertIsNot(big, small)
+        self.assertIs(write_handlers._scratch(10), small)
+
+    def test_write_atomic_replaces_file_and_keeps_mode(self):
+        path = os.path.join(self.temp_dir, "run.sh")
+        with open(path, "w") as f:
+            f.write("old\n")
+        os.chmod(path, 0o755)
+        with _flag_env({"LOCALCODE_WRITE_ATOMIC": "1"}):
+            result = agent.write({"path": path, "content": "new\n"})
+        self.assertTrue(result.startswith("ok: updated"), result)
+        with open(path) as f:
+            self.assertEqual(f.read(), "new\n")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o755)
+        self.assertEqual(os.listdir(self.temp_dir), ["run.sh"])
+
+    def test_write_atomic_through_symlink_updates_target(self):
+        real = os.path.join(self.temp_dir, "real.txt")
+        link = os.path.join(self.temp_dir, "link.txt")
+        with open(real, "w") as f:
+            f.write("old\n")
+        os.symlink(real, link)
+        with _flag_env({"LOCALCODE_WRITE_ATOMIC": "1"}):
+            result = agent.write({"path": link, "content": "new\n"})
+        self.assertTrue(result.startswith("ok: updated"), result)
+        self.assertTrue(os.path.islink(link))
+        with open(real) as f:
+            self.assertEqual(f.read(), "new\n")
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["link.txt", "real.txt"])
+
+    def test_write_atomic_keeps_hard_links_together(self):
+        path = os.path.join(self.temp_dir, "a.txt")
+        other = os.path.join(self.temp_dir, "b.txt")
+        with open(path, "w") as f:
+            f.write("old\n")
+        os.link(path, other)
+        with _flag_env({"LOCALCODE_WRITE_ATOMIC": "1"}):
+            agent.write({"path": path, "content": "new\n"})
+        with open(other) as f:
+            self.assertEqual(f.read(), "new\n")
+        self.assertTrue(os.path.samefile(path, other))
+
+    def test_write_durable_syncs_before_rename(self):
+        from localcode.tool_handlers import write_handlers
+        path = os.path.join(self.temp_dir, "test.txt")
+        with patch.object(write_handlers, "_fdatasync") as sync_mock:
+            with _flag_env({"LOCALCODE_WRITE_ATOMIC": "1"}):
+                agent.write({"path": path, "content": "a\n"})
+            sync_mock.assert_not_called()
+            with _flag_env({"LOCALCODE_WRITE_ATOMIC": "1", "LOCALCODE_WRITE_DURABLE": "1"}):
+                agent.write({"path": path, "content": "b\n"})
+            sync_mock.assert_called_once()
+        with open(path) as f:
+            self.assertEqual(f.read(), "b\n")
+
+    def test_write_reuses_tracked_line_count(self):
+        from localcode.tool_handlers import _state
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "a\nb\n"})
+        self.assertEqual(_state._LINE_COUNTS[path], ("a\nb\n", 2))
+        self.assertEqual(_state._cached_newline_count(path, "a\nb\n"), 2)
+        self.assertEqual(_state._cached_newline_count(path, "a\n"), 1)
+        result = agent.write({"path": path, "content": "a\n"})
+        self.assertIn("+0 -1 lines", result)
+
+    def test_write_new_file_counts_unterminated_last_line(self):
+        path = os.path.join(self.temp_dir, "new.txt")
+        result = agent.write({"path": path, "content": "a\nb"})
+        self.assertIn("+2 lines", result)
+        empty = agent.write({"path": os.path.join(self.temp_dir, "empty.txt"), "content": ""})
+        self.assertIn("+0 lines", empty)
+
+    def test_edit_tracks_line_count_from_bytes(self):
+        from localcode.tool_handlers import _state
+        from localcode.tool_handlers.write_handlers import _content_line_count
+        path = os.path.join(self.temp_dir, "test.txt")
+        agent.write({"path": path, "content": "h\u00e9llo\nworld"})
+        with _flag_env({"LOCALCODE_EDIT_VERBOSE_STATE": "1"}):
+            result = agent.edit({"path": path, "old": "world", "new": "w\u00f6rld\nagain"})
+        self.assertEqual(_state._LINE_COUNTS[path][1], 2)
+        self.assertIn("file_state: lines=3 ", result)
+        self.assertEqual(_content_line_count(b""), 0)
+        self.assertEqual(_content_line_count(b"a\n"), 1)
+
+    def test_write_same_size_late_mismatch_reports_diff(self):
+        path = os.path.join(self.temp_dir, "big.txt")
+        body = "".join(f"line{i:05d}\n" for i in range(25000))
+        with open(path, "w") as f:
+            f.write(body + "old\n")
+        result = agent.write({"path": path, "content": body + "new\n"})
+        self.assertTrue(result.startswith("ok: updated"), result)
+        self.assertIn("changed_lines~=1", result)
+
+    def test_changed_lines_trim_repeated_lines(self):
+        from localcode.tool_handlers.write_handlers import _changed_line_preview, _changed_lines_est
+        before = "x\n" * 20000
+        after = "x\n" * 10000 + "y\n" + "x\n" * 9999
+        self.assertEqual(_changed_lines_est(before, after), 1)
+        self.assertIn("10001", _changed_line_preview(before, after))
+
+    def test_patch_changed_lines_share_one_trimmed_diff(self):
+        from localcode.tool_handlers import patch_handlers
+        before = "x\n" * 20000
+        after = "x\n" * 10000 + "y\n" + "x\n" * 9999
+        diff = patch_handlers._changed_opcodes(before, after)
+        self.assertEqual(diff[1], [("replace", 10000, 10001, 10000, 10001)])
+        self.assertEqual(patch_handlers._changed_lines_est(before, after, diff=diff), 1)
+        self.assertIn("10001| y", patch_handlers._changed_line_preview(before, after, diff=diff))
+
+    def test_diff_bundle_skips_matcher_for_pure_insert(self):
+        from localcode.tool_handlers import write_handlers
+        with patch.object(write_handlers.difflib, "SequenceMatcher") as matcher:
+            bundle = write_handlers._diff_bundle("", "a\nb\n")
+            deleted = write_handlers._diff_bundle("a\nb\n", "a\n")
+        matcher.assert_not_called()
+        self.assertEqual(bundle["opcodes"], [("insert", 0, 0, 0, 2)])
+        self.assertEqual(bundle["changed_lines"], 2)
+        self.assertEqual(deleted["opcodes"], [("delete", 0, 1, 0, 0)])
+
+    def test_trim_common_suffix_stops_at_prefix(self):
+        from localcode.tool_handlers._state import _trim_common
+        self.assertEqual(_trim_common(["a", "a"], ["a", "a", "a"]), (2, [], ["a"]))
+        self.assertEqual(_trim_common(["a", "b", "c"], ["a", "x", "c"]), (1, ["b"], ["x"]))
+        self.assertEqual(_trim_common([], ["a"]), (0, [], ["a"]))
+
     def test_edit_old_equals_new_returns_error(self):
         path = os.path.join(self.temp_dir, "test.txt")
         with open(path, "w") as f:
@@ -2334,12 +3196,14 @@ class TestApplyPatchNoopDetection(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
 
     def tearDown(self):
         import shutil
         shutil.rmtree(self.temp_dir)
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
         agent.FILE_VERSIONS.clear()
 
@@ -2390,6 +3254,21 @@ class TestApplyPatchNoopDetection(unittest.TestCase):
         result = agent.apply_patch_fn({"patch": patch})
         self.assertTrue(result.startswith("ok:"), f"Expected ok, got: {result}")
 
+    def test_apply_patch_add_writes_utf8_bytes(self):
+        """Added files are written as the exact UTF-8 bytes of the patch lines."""
+        path = os.path.join(self.temp_dir, "new.txt")
+        patch = (
+            f"*** Begin Patch\n"
+            f"*** Add File: {path}\n"
+            f"+caf\u00e9\n"
+            f"+line2\n"
+            f"*** End Patch"
+        )
+        result = agent.apply_patch_fn({"patch": patch})
+        self.assertTrue(result.startswith("ok:"), f"Expected ok, got: {result}")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), "caf\u00e9\nline2\n".encode("utf-8"))
+
 
 class TestDidToolMakeChange(unittest.TestCase):
     """Test _did_tool_make_change helper."""
@@ -2451,12 +3330,14 @@ class TestPerFilePatchHash(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
 
     def tearDown(self):
         import shutil
         shutil.rmtree(self.temp_dir)
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
         agent.FILE_VERSIONS.clear()
 
@@ -2620,12 +3501,14 @@ class TestHashResetOnRead(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
 
     def tearDown(self):
         import shutil
         shutil.rmtree(self.temp_dir)
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
         _inner._LAST_PATCH_HASH.clear()
         agent.FILE_VERSIONS.clear()
 
@@ -2666,11 +3549,13 @@ class TestWriteHintOnSecondNoop(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
 
     def tearDown(self):
         import shutil
         shutil.rmtree(self.temp_dir)
         _inner._NOOP_COUNTS.clear()
+        _tool_state._NOOP_WRITE_COUNTS.clear()
 
     def test_hint_appears_on_second_noop(self):
         """Second no-op write should include repeated-noop guidance."""
@@ -3198,6 +4083,12 @@ class TestSandboxPathValidation(unittest.TestCase):
         result = _inner._validate_path(deep, check_exists=True)
         self.assertEqual(result, os.path.realpath(deep))
 
+    def test_returns_interned_path(self):
+        f = os.path.join(self.temp_dir, "interned.txt")
+        first = _inner._validate_path(f, check_exists=False)
+        second = _inner._validate_path("".join([f]), check_exists=False)
+        self.assertIs(first, second)
+
 
 class TestDangerousPatternsCoverage(unittest.TestCase):
     """Comprehensive coverage of DANGEROUS_PATTERNS — each pattern exercised."""
@@ -25,6 +25,7 @@ from localcode.tool_handlers._state import (
     UNSUPPORTED_TOOLS,
     _LAST_PATCH_HASH,
     _NOOP_COUNTS,
+    _NOOP_WRITE_COUNTS,
     _PATCH_FILE_RE,
     _read_file_bytes,
     _require_args_dict,
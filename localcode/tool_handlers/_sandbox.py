@@ -7,7 +7,7 @@ Stdlib only — no imports from other tool_handlers modules.
 import os
 import re
 import shlex
-from typing import Optional
+from typing import List, Optional
 
 
 # Dangerous command patterns (soft sandbox)
@@ -77,6 +77,18 @@ TEST_MENTION_RE = re.compile(
 )
 
 
+# Commands made only of printable ASCII without quotes or backslashes split
+# exactly like shlex.split() on plain whitespace.
+_NEEDS_SHLEX_RE = re.compile(r"[^\x20-\x7e\t]|[\"'\\]")
+
+
+def _split_command(command: str) -> List[str]:
+    """shlex.split() with a fast path for commands that need no unquoting."""
+    if not _NEEDS_SHLEX_RE.search(command):
+        return command.split()
+    return shlex.split(command)
+
+
 def _check_dangerous_command(command: str) -> Optional[str]:
     for pattern_re in _DANGEROUS_COMMAND_RES:
         if pattern_re.search(command):
@@ -87,7 +99,7 @@ def _check_dangerous_command(command: str) -> Optional[str]:
 def _check_sandbox_allowlist(command: str) -> Optional[str]:
     """Return an error string if command's binary is not in the sandbox allowlist, else None."""
     try:
-        tokens = shlex.split(command)
+        tokens = _split_command(command)
     except ValueError:
         # Malformed quoting — shlex.split in shell() will catch this too
         tokens = command.split()
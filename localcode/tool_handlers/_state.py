@@ -7,7 +7,9 @@ No module in tool_handlers/ imports from localcode.localcode.
 """
 
 import hashlib
+import itertools
 import json
+import operator
 import os
 import re
 from collections import OrderedDict
@@ -38,6 +40,18 @@ MAX_SHELL_TIMEOUT_MS = 10 * 60 * 1000
 # Track last-read versions (LRU cache, max 200 entries)
 FILE_VERSIONS: OrderedDict = OrderedDict()
 
+# Newline count of tracked content: {path: (content, content.count("\n"))}
+_LINE_COUNTS: Dict[str, Tuple[str, int]] = {}
+
+# Files as last written by write()/edit():
+# {path: (stat signature, content, sha, time.time_ns() when recorded)}.
+# While the signature still matches, the file is known to hold `content`
+# (write_handlers._written_content re-checks entries recorded near the mtime).
+_WRITTEN_STATS: Dict[str, Tuple[Tuple[int, int, int, int], str, str, int]] = {}
+
+# Digests of files hashed from disk: {path: (stat signature, sha)}.
+_DIGEST_CACHE: Dict[str, Tuple[Tuple[int, int, int, int], str]] = {}
+
 # Sandbox root (cwd by default unless --no-sandbox)
 SANDBOX_ROOT: Optional[str] = None
 
@@ -51,8 +65,21 @@ UNSUPPORTED_TOOLS: Dict[str, str] = {}
 # Track last patch hash per file to detect repeated identical patches
 _LAST_PATCH_HASH: Dict[str, str] = {}
 
+
+class _NoopCounts:
+    """Per-file no-op streaks for apply_patch/edit and the edit() real-change count."""
+
+    __slots__ = ("apply_patch", "edit_noop", "edit_real")
+
+    def __init__(self) -> None:
+        self.apply_patch = 0
+        self.edit_noop = 0
+        self.edit_real = 0
+
+
 # Track consecutive no-op counts per file per tool
-_NOOP_COUNTS: Dict[str, Dict[str, int]] = {}  # {path: {"apply_patch": N, "write": N}}
+_NOOP_COUNTS: Dict[str, _NoopCounts] = {}
+_NOOP_WRITE_COUNTS: Dict[str, int] = {}  # {path: N} for write(), the hottest counter
 
 # Track files written via write_file (for next-step hints in read)
 WRITTEN_PATHS: set = set()
@@ -62,9 +89,16 @@ TOOL_CALL_COUNT: int = 0
 
 # Monotonic mutation sequence and compact mutation state for tool-result snapshots
 MUTATION_SEQ: int = 0
+# Like MUTATION_SEQ but never reset, so caches keyed on it cannot see entries
+# from before a session reset match again.
+MUTATION_EPOCH: int = 0
 MUTATION_HISTORY: List[Dict[str, Any]] = []
 FILE_SHA_STATE: Dict[str, str] = {}
 
+# _find_and_read_spec() results:
+# {sandbox: (root st_mtime_ns, MUTATION_EPOCH, spec path or None)}.
+_SPEC_SEARCH_RESULTS: Dict[str, Tuple[int, int, Optional[str]]] = {}
+
 # Extract the first file path from a unified patch block.
 _PATCH_FILE_RE = re.compile(r"^\*\*\* (?:Update File|Add File|Delete File):\s+(.+)$", re.MULTILINE)
 
@@ -90,6 +124,7 @@ def _reset_noop_tracking() -> None:
     global TOOL_CALL_COUNT, MUTATION_SEQ
     _LAST_PATCH_HASH.clear()
     _NOOP_COUNTS.clear()
+    _NOOP_WRITE_COUNTS.clear()
     WRITTEN_PATHS.clear()
     TOOL_CALL_COUNT = 0
     MUTATION_SEQ = 0
@@ -97,6 +132,50 @@ def _reset_noop_tracking() -> None:
     FILE_SHA_STATE.clear()
 
 
+def _normalize_newlines(text: str) -> str:
+    """Translate "\r\n" and "\r" to "\n", as text-mode open() does on read."""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _trim_common(a: List[str], b: List[str]) -> Tuple[int, List[str], List[str]]:
+    """Strip the lines *a* and *b* share at both ends.
+
+    Returns the common prefix length and the two differing middles, so the
+    (worst-case quadratic) SequenceMatcher only sees what actually changed.
+    """
+    # compress(count(), map(ne, ...)) yields the index of the first mismatch
+    # without a Python-level loop; map stops at the shorter list.
+    limit = min(len(a), len(b))
+    prefix = next(itertools.compress(itertools.count(), map(operator.ne, a, b)), limit)
+    limit -= prefix
+    suffix = next(
+        itertools.compress(itertools.count(), map(operator.ne, reversed(a), reversed(b))),
+        limit,
+    )
+    # The suffix may not reach back into the prefix.
+    suffix = min(suffix, limit)
+    return prefix, a[prefix:len(a) - suffix], b[prefix:len(b) - suffix]
+
+
+def _read_fd_bytes(path: str, limit: int) -> bytes:
+    """Read up to *limit* bytes of *path* with os.read. Raises OSError like open()."""
+    fd = os.open(path, os.O_RDONLY)
+    chunks: List[bytes] = []
+    remaining = limit
+    try:
+        while remaining > 0:
+            chunk = os.read(fd, remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+    finally:
+        os.close(fd)
+    return b"".join(chunks)
+
+
 def _read_file_bytes(path: str) -> Optional[bytes]:
     """Read file as raw bytes. Returns None on error."""
     try:
@@ -106,6 +185,24 @@ def _read_file_bytes(path: str) -> Optional[bytes]:
         return None
 
 
+def _write_fd(fd: int, data: bytes) -> None:
+    """Write all of *data* to *fd*, looping only over short writes."""
+    view = memoryview(data)
+    off = 0
+    while off < len(view):
+        off += os.write(fd, view[off:])
+
+
+def _write_file_bytes(path: str, data: bytes) -> os.stat_result:
+    """Replace *path* with raw bytes via os.open/os.write. Returns the stat."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        _write_fd(fd, data)
+        return os.fstat(fd)
+    finally:
+        os.close(fd)
+
+
 def _sha256(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
@@ -115,8 +212,9 @@ def _short_sha_text(text: str) -> str:
 
 
 def _next_mutation_id() -> str:
-    global MUTATION_SEQ
+    global MUTATION_SEQ, MUTATION_EPOCH
     MUTATION_SEQ += 1
+    MUTATION_EPOCH += 1
     return f"m{MUTATION_SEQ:05d}"
 
 
@@ -242,13 +340,32 @@ def _mutation_brief_line(event: Dict[str, Any]) -> str:
     return " ".join(parts)
 
 
-def _track_file_version(path: str, content: str) -> None:
-    """Store file content in LRU cache, evicting oldest if over limit."""
+def _track_file_version(path: str, content: str, newlines: Optional[int] = None) -> None:
+    """Store file content in LRU cache, evicting oldest if over limit.
+
+    `newlines` is content.count("\n") when the caller already has it.
+    """
     if path in FILE_VERSIONS:
         FILE_VERSIONS.move_to_end(path)
     FILE_VERSIONS[path] = content
+    _LINE_COUNTS[path] = (content, content.count("\n") if newlines is None else newlines)
     while len(FILE_VERSIONS) > MAX_FILE_VERSIONS:
-        FILE_VERSIONS.popitem(last=False)
+        evicted, _ = FILE_VERSIONS.popitem(last=False)
+        _LINE_COUNTS.pop(evicted, None)
+        _WRITTEN_STATS.pop(evicted, None)
+        _DIGEST_CACHE.pop(evicted, None)
+
+
+def _stat_signature(st: os.stat_result) -> Tuple[int, int, int, int]:
+    return (st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino)
+
+
+def _cached_newline_count(path: str, content: str) -> int:
+    """content.count("\n"), reusing the count stored when `content` was tracked."""
+    cached = _LINE_COUNTS.get(path)
+    if cached is not None and cached[0] == content:
+        return cached[1]
+    return content.count("\n")
 
 
 def extract_patch_file(patch_text: str) -> Optional[str]:
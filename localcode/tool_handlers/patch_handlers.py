@@ -12,25 +12,51 @@ from localcode.tool_handlers._state import (
     FILE_VERSIONS,
     _LAST_PATCH_HASH,
     _NOOP_COUNTS,
+    _NoopCounts,
     _mutation_brief_line,
     _mutation_decision_hint,
     _mutation_state_line,
+    _normalize_newlines,
     _record_mutation,
     _read_file_bytes,
     _require_args_dict,
     _sha256,
     _short_sha_text,
     _track_file_version,
+    _trim_common,
+    _write_file_bytes,
 )
 from localcode.tool_handlers._path import _should_block_test_edit, _validate_path, to_display_path
 
 
-def _changed_lines_est(previous: str, current: str) -> int:
+# Current lines plus the non-equal opcodes, as returned by _changed_opcodes().
+_PatchDiff = Tuple[List[str], List[Tuple[str, int, int, int, int]]]
+
+
+def _changed_opcodes(previous: str, current: str) -> _PatchDiff:
+    """Split and diff *previous* against *current* once.
+
+    Returns the current lines and the non-equal opcodes in full-text line
+    indexes. Only the lines left after trimming the common prefix and suffix
+    reach the SequenceMatcher, so a small patch to a large file stays cheap.
+    """
     prev_lines = previous.splitlines()
     curr_lines = current.splitlines()
-    matcher = difflib.SequenceMatcher(a=prev_lines, b=curr_lines, autojunk=False)
+    prefix, prev_mid, curr_mid = _trim_common(prev_lines, curr_lines)
+    matcher = difflib.SequenceMatcher(a=prev_mid, b=curr_mid, autojunk=False)
+    opcodes = [
+        (tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+    return curr_lines, opcodes
+
+
+def _changed_lines_est(previous: str, current: str, diff: Optional[_PatchDiff] = None) -> int:
+    if diff is None:
+        diff = _changed_opcodes(previous, current)
     changed = 0
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    for tag, i1, i2, j1, j2 in diff[1]:
         if tag == "replace":
             changed += max(i2 - i1, j2 - j1)
         elif tag == "delete":
@@ -40,15 +66,18 @@ def _changed_lines_est(previous: str, current: str) -> int:
     return changed
 
 
-def _changed_line_preview(previous: str, current: str, max_lines: int = 4) -> str:
-    prev_lines = previous.splitlines()
-    curr_lines = current.splitlines()
-    matcher = difflib.SequenceMatcher(a=prev_lines, b=curr_lines, autojunk=False)
+def _changed_line_preview(
+    previous: str,
+    current: str,
+    max_lines: int = 4,
+    diff: Optional[_PatchDiff] = None,
+) -> str:
+    if diff is None:
+        diff = _changed_opcodes(previous, current)
+    curr_lines, opcodes = diff
     changed_indexes: List[int] = []
     seen = set()
-    for tag, _i1, _i2, j1, j2 in matcher.get_opcodes():
-        if tag == "equal":
-            continue
+    for tag, _i1, _i2, j1, j2 in opcodes:
         if j1 < j2:
             for idx in range(j1, min(j2, j1 + max_lines)):
                 if idx not in seen:
@@ -183,11 +212,22 @@ def _apply_hunks(text_lines: List[str], hunks: List[List[str]], file_path: str =
     return text_lines
 
 
-def _apply_update_patch(path: str, change_lines: List[str], move_to: Optional[str] = None) -> None:
-    if not os.path.exists(path):
-        raise ValueError(f"file not found: {to_display_path(path)}")
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
+def _apply_update_patch(
+    path: str,
+    change_lines: List[str],
+    move_to: Optional[str] = None,
+    data: Optional[bytes] = None,
+) -> bytes:
+    """Apply hunks to *path* and return the bytes written.
+
+    *data* is the file's current content when the caller already read it.
+    """
+    if data is None:
+        if not os.path.exists(path):
+            raise ValueError(f"file not found: {to_display_path(path)}")
+        with open(path, "rb") as f:
+            data = f.read()
+    text = _normalize_newlines(data.decode("utf-8"))
     had_trailing_newline = text.endswith("\n") or text.endswith("\r")
     crlf = text.count("\r\n")
     lf = text.count("\n") - crlf
@@ -198,13 +238,15 @@ def _apply_update_patch(path: str, change_lines: List[str], move_to: Optional[st
     new_text = newline.join(text_lines)
     if had_trailing_newline:
         new_text += newline
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(new_text)
+    new_data = new_text.encode("utf-8")
+    _write_file_bytes(path, new_data)
     if move_to:
         os.replace(path, move_to)
+    return new_data
 
 
-def _apply_add_patch(path: str, change_lines: List[str]) -> None:
+def _apply_add_patch(path: str, change_lines: List[str]) -> bytes:
+    """Create *path* from the "+" lines and return the bytes written."""
     if os.path.exists(path):
         raise ValueError(f"file already exists: {to_display_path(path)}")
     content: List[str] = []
@@ -218,8 +260,9 @@ def _apply_add_patch(path: str, change_lines: List[str]) -> None:
     parent = os.path.dirname(path)
     if parent and not os.path.exists(parent):
         os.makedirs(parent, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(new_text)
+    new_data = new_text.encode("utf-8")
+    _write_file_bytes(path, new_data)
+    return new_data
 
 
 def _apply_delete_patch(path: str) -> None:
@@ -329,17 +372,18 @@ def apply_patch_fn(args: Any) -> str:
                     elif cl.startswith("-") and not cl.startswith("---"):
                         removals += 1
                     idx += 1
-                _apply_update_patch(path, change_lines, move_to=move_to)
+                # The snapshot doubles as the patch input; the result is what was written.
+                new_bytes = _apply_update_patch(path, change_lines, move_to=move_to, data=old_bytes)
                 updated = move_to or path
                 # Check for no-op (file unchanged after patch)
-                new_bytes = _read_file_bytes(updated)
                 before_sha = _sha256(old_bytes)[:12] if old_bytes is not None else "unknown"
                 after_sha = _sha256(new_bytes)[:12] if new_bytes is not None else "unknown"
                 if old_bytes is not None and new_bytes is not None and old_bytes == new_bytes:
-                    noop_key = updated
-                    _NOOP_COUNTS.setdefault(noop_key, {})
-                    _NOOP_COUNTS[noop_key]["apply_patch"] = _NOOP_COUNTS[noop_key].get("apply_patch", 0) + 1
-                    noop_n = _NOOP_COUNTS[noop_key]["apply_patch"]
+                    counts = _NOOP_COUNTS.get(updated)
+                    if counts is None:
+                        counts = _NOOP_COUNTS[updated] = _NoopCounts()
+                    counts.apply_patch += 1
+                    noop_n = counts.apply_patch
                     mutation = _record_mutation(
                         op="apply_patch",
                         path=updated,
@@ -366,13 +410,12 @@ def apply_patch_fn(args: Any) -> str:
                         f"{state_line}"
                     )
                 try:
-                    with open(updated, "r", encoding="utf-8") as f:
-                        _track_file_version(updated, f.read())
+                    _track_file_version(updated, _normalize_newlines(new_bytes.decode("utf-8")))
                 except Exception:
                     FILE_VERSIONS.pop(updated, None)
                 # Clear noop count on real change
                 if updated in _NOOP_COUNTS:
-                    _NOOP_COUNTS[updated].pop("apply_patch", None)
+                    _NOOP_COUNTS[updated].apply_patch = 0
                 if move_to and updated != path:
                     FILE_VERSIONS.pop(path, None)
                 # Store hash for this file now (half-success safe)
@@ -394,12 +437,13 @@ def apply_patch_fn(args: Any) -> str:
                 state_lines.append(_mutation_state_line(mutation))
                 old_text = old_bytes.decode("utf-8", errors="replace") if old_bytes is not None else ""
                 new_text = new_bytes.decode("utf-8", errors="replace") if new_bytes is not None else ""
-                changed_est = _changed_lines_est(old_text, new_text)
+                diff = _changed_opcodes(old_text, new_text)
+                changed_est = _changed_lines_est(old_text, new_text, diff=diff)
                 change_summaries.append(
                     f"{os.path.basename(updated)}: sha={before_sha}->{after_sha} changed_lines~={changed_est}"
                 )
                 preview_blocks.append(
-                    f"{os.path.basename(updated)}:\n{_changed_line_preview(old_text, new_text)}"
+                    f"{os.path.basename(updated)}:\n{_changed_line_preview(old_text, new_text, diff=diff)}"
                 )
                 files_changed.append(updated)
                 continue
@@ -415,13 +459,12 @@ def apply_patch_fn(args: Any) -> str:
                     if cl.startswith("+"):
                         additions += 1
                     idx += 1
-                _apply_add_patch(path, change_lines)
+                new_bytes = _apply_add_patch(path, change_lines)
                 after_sha = "unknown"
                 try:
-                    with open(path, "r", encoding="utf-8") as f:
-                        txt = f.read()
-                        _track_file_version(path, txt)
-                        after_sha = _short_sha_text(txt)
+                    txt = _normalize_newlines(new_bytes.decode("utf-8"))
+                    _track_file_version(path, txt)
+                    after_sha = _short_sha_text(txt)
                 except Exception:
                     FILE_VERSIONS.pop(path, None)
                 if path in patch_file_hashes:
@@ -451,10 +494,10 @@ def apply_patch_fn(args: Any) -> str:
                 before_sha = "unknown"
                 if os.path.exists(path):
                     try:
-                        with open(path, "r", encoding="utf-8") as f:
-                            txt = f.read()
-                            removals += len(txt.splitlines())
-                            before_sha = _short_sha_text(txt)
+                        with open(path, "rb") as f:
+                            txt = _normalize_newlines(f.read().decode("utf-8"))
+                        removals += len(txt.splitlines())
+                        before_sha = _short_sha_text(txt)
                     except Exception:
                         pass
                 _apply_delete_patch(path)
@@ -486,8 +529,11 @@ def apply_patch_fn(args: Any) -> str:
         stats_parts: List[str] = []
         for changed_path in files_changed[:3]:
             try:
-                with open(changed_path, "r", encoding="utf-8") as fh:
-                    txt = fh.read()
+                # Content tracked above is what a fresh read would return.
+                txt = FILE_VERSIONS.get(changed_path)
+                if txt is None:
+                    with open(changed_path, "rb") as fh:
+                        txt = _normalize_newlines(fh.read().decode("utf-8"))
                 line_count = txt.count("\n") + (0 if txt.endswith("\n") else 1 if txt else 0)
                 digest = hashlib.sha256(txt.encode("utf-8")).hexdigest()[:12]
                 stats_parts.append(
@@ -13,6 +13,8 @@ from localcode.tool_handlers._state import (
     MAX_FILE_SIZE,
     MAX_LINE_LENGTH,
     _LAST_PATCH_HASH,
+    _normalize_newlines,
+    _read_fd_bytes,
     _require_args_dict,
     _track_file_version,
 )
@@ -89,10 +91,10 @@ def read(args: Any) -> str:
         return f"error: cannot stat file: {display_path}"
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            content = f.read(MAX_FILE_SIZE + 1)
-            if len(content) > MAX_FILE_SIZE:
-                return f"error: file content exceeds {MAX_FILE_SIZE} bytes during read"
+        data = _read_fd_bytes(path, MAX_FILE_SIZE + 1)
+        if len(data) > MAX_FILE_SIZE:
+            return f"error: file content exceeds {MAX_FILE_SIZE} bytes during read"
+        content = _normalize_newlines(data.decode("utf-8"))
     except FileNotFoundError:
         return f"error: file not found: {display_path}"
     except IsADirectoryError:
@@ -2,13 +2,37 @@
 Search tool handlers: glob_fn(), grep_fn(), search_fn(), ls_fn().
 """
 
+import base64
 import fnmatch
+import functools
 import glob as globlib
+import json
+import locale
+import mmap
 import os
 import re
 import shutil
+import stat
 import subprocess
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import itemgetter
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:  # Optional: faster parsing of rg --json output.
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:  # Optional (google-re2): linear-time matching for the fallback grep, no ReDoS.
+    import re2 as _re2
+    _RE2_OPTIONS = _re2.Options()
+    _RE2_OPTIONS.log_errors = False
+except (ImportError, AttributeError):
+    _re2 = None
+    _RE2_OPTIONS = None
 
 from localcode.tool_handlers import _state
 from localcode.tool_handlers._state import (
@@ -21,21 +45,341 @@ from localcode.tool_handlers._state import (
 from localcode.tool_handlers._path import _is_ignored_path, _validate_path, to_display_path
 
 
-_HIT_RE = re.compile(r"^(.*?):([0-9]+):(.*)$")
+_MAX_SCAN_FILES = 2000
+_MAX_SCAN_BYTES = 50 * 1024 * 1024  # 50MB
+_SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Scans in flight at once; results are drained in walk order past this.
+_SCAN_WINDOW = _SCAN_WORKERS * 2
+# Larger files are memory-mapped for literal searches instead of decoded.
+_MMAP_THRESHOLD = 64 * 1024
+_REGEX_META_RE = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+# Resolved once at import; shutil.which walks $PATH on every call.
+_RG_PATH: Optional[str] = shutil.which("rg")
+
+
+def _refresh_rg_path() -> Optional[str]:
+    """Re-resolve the rg binary (e.g. after PATH changes in tests)."""
+    global _RG_PATH
+    _RG_PATH = shutil.which("rg")
+    return _RG_PATH
+
+
+_RG_LONG_LINE_MARKER = " [... omitted end of long line]"
+
+# Ignored directories are excluded by rg itself, so its output needs no
+# post-filtering in Python.
+_IGNORE_GLOBS = tuple(f"!{d}" for d in sorted(DEFAULT_IGNORE_DIRS))
+_RG_MAX_COLUMNS = 150
+
+# Bare-word includes naming a known language (e.g. "py", "rust") expand to
+# that language's file globs. Any other include, including bare file names
+# such as "Makefile", is used as a glob as-is. Both rg and the Python
+# fallback use the same globs, so results do not depend on rg being present.
+_INCLUDE_LANGUAGE_GLOBS: Dict[str, Tuple[str, ...]] = {
+    "py": ("*.py", "*.pyi"),
+    "python": ("*.py", "*.pyi"),
+    "js": ("*.js", "*.mjs", "*.cjs", "*.jsx"),
+    "javascript": ("*.js", "*.mjs", "*.cjs", "*.jsx"),
+    "ts": ("*.ts", "*.mts", "*.cts", "*.tsx"),
+    "typescript": ("*.ts", "*.mts", "*.cts", "*.tsx"),
+    "rs": ("*.rs",),
+    "rust": ("*.rs",),
+    "go": ("*.go",),
+    "java": ("*.java",),
+    "c": ("*.c", "*.h"),
+    "cpp": ("*.cpp", "*.cc", "*.cxx", "*.hpp", "*.hh", "*.hxx", "*.h"),
+    "rb": ("*.rb",),
+    "ruby": ("*.rb",),
+    "php": ("*.php",),
+    "sh": ("*.sh", "*.bash"),
+    "json": ("*.json",),
+    "yml": ("*.yml", "*.yaml"),
+    "yaml": ("*.yml", "*.yaml"),
+    "toml": ("*.toml",),
+    "md": ("*.md", "*.markdown"),
+    "markdown": ("*.md", "*.markdown"),
+    "html": ("*.html", "*.htm"),
+    "css": ("*.css",),
+}
+
+
+def _include_globs(include: Optional[str]) -> Tuple[str, ...]:
+    if not include:
+        return ()
+    include = str(include)
+    return _INCLUDE_LANGUAGE_GLOBS.get(include.lower(), (include,))
+
+
+def _rg_filter_args(include: Optional[str] = None) -> List[str]:
+    args: List[str] = []
+    for g in _IGNORE_GLOBS:
+        args.extend(["-g", g])
+    for g in _include_globs(include):
+        args.extend(["--glob", g])
+    return args
+
+
+def _run_rg(
+    cmd: List[str], limit: int, parse: Callable[[bytes], Optional[str]],
+) -> Optional[Tuple[List[str], bool]]:
+    """Stream rg stdout, stopping once more than `limit` results were parsed.
+
+    `parse` turns one raw output line into a result (None skips it), so
+    lines past the limit are never decoded. Returns (results, truncated),
+    or None when rg failed without output.
+    """
+    results: List[str] = []
+    truncated = False
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        for ln in proc.stdout:
+            item = parse(ln)
+            if item is None:
+                continue
+            if len(results) >= limit:
+                truncated = True
+                proc.terminate()
+                break
+            results.append(item)
+    if not results and proc.returncode not in (0, 1):
+        return None
+    return results, truncated
+
+
+@functools.lru_cache(maxsize=256)
+def _get_pattern(pat: str, literal: bool, multiline: bool = False) -> re.Pattern:
+    source = re.escape(pat) if literal else pat
+    if _re2 is not None:
+        try:
+            return _re2.compile(("(?m)" + source) if multiline else source, options=_RE2_OPTIONS)
+        except Exception:
+            pass  # Unsupported syntax (backreferences, lookaround): use stdlib re.
+    return re.compile(source, re.MULTILINE if multiline else 0)
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace")
 
 
-def _extract_hit_path(line: str) -> str:
-    match = _HIT_RE.match(line)
-    if match:
-        return match.group(1)
-    return line.split(":", 1)[0]
+def _rg_text(field: Dict[str, Any]) -> str:
+    # rg --json reports non-UTF-8 data as base64 under "bytes".
+    if "text" in field:
+        return field["text"]
+    return _decode(base64.b64decode(field.get("bytes", "")))
 
 
-def _render_hit_line(line: str) -> str:
-    match = _HIT_RE.match(line)
-    if not match:
-        return line
-    return f"{to_display_path(match.group(1))}:{match.group(2)}:{match.group(3)}"
+def _parse_file_line(line: bytes) -> Optional[str]:
+    line = line.strip()
+    return _decode(line) if line else None
+
+
+def _clip_line(text: str) -> str:
+    """Shorten a hit line the way rg --max-columns previews it."""
+    if len(text) > _RG_MAX_COLUMNS:
+        return text[:_RG_MAX_COLUMNS] + _RG_LONG_LINE_MARKER
+    return text
+
+
+def _parse_json_hit(line: bytes) -> Optional[str]:
+    """Render one rg --json "match" event as "path:line:text"."""
+    if b'"type":"match"' not in line:
+        return None
+    try:
+        data = _json_loads(line)["data"]
+        path = _rg_text(data["path"])
+        text = _rg_text(data["lines"]).rstrip("\r\n")
+        ln_no = data["line_number"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    # --max-columns does not apply to --json output; truncate like rg's preview.
+    return f"{to_display_path(path)}:{ln_no}:{_clip_line(text)}"
+
+
+def _line_matches(rx: re.Pattern, line: str) -> bool:
+    if rx.search(line):
+        return True
+    # RE2's "$" only matches at the very end of the text; retry without the
+    # newline to get Python's "end or before a trailing newline" behaviour.
+    return not isinstance(rx, re.Pattern) and line.endswith("\n") and bool(rx.search(line[:-1]))
+
+
+def _literal_needle(pat: str, literal: bool) -> Optional[bytes]:
+    """Return the encoded search string when `pat` matches only itself."""
+    if not literal and _REGEX_META_RE.search(pat):
+        return None
+    if not pat or "\n" in pat or "\r" in pat:
+        return None
+    try:
+        return pat.encode(locale.getpreferredencoding(False))
+    except (UnicodeEncodeError, LookupError):
+        return None
+
+
+def _scan_mapped(fp: str, needle: bytes, limit: int) -> List[str]:
+    """Literal search over a memory-mapped file; only hit lines are decoded."""
+    hits: List[str] = []
+    try:
+        with open(fp, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            encoding = locale.getpreferredencoding(False)
+            size = len(mm)
+            display = None
+            ln_no = 1
+            counted = 0
+            pos = 0
+            while pos < size:
+                start = mm.find(needle, pos)
+                if start < 0:
+                    break
+                nl = mm.rfind(b"\n", pos, start)
+                line_start = pos if nl < 0 else nl + 1
+                line_end = mm.find(b"\n", start)
+                if line_end < 0:
+                    line_end = size
+                ln_no += mm[counted:line_start].count(b"\n")
+                counted = line_start
+                if display is None:
+                    display = to_display_path(fp)
+                text = mm[line_start:line_end].decode(encoding, errors="ignore")
+                hits.append(f"{display}:{ln_no}:{_clip_line(text.rstrip())}")
+                if len(hits) >= limit:
+                    break
+                pos = line_end + 1
+    except (OSError, ValueError):
+        return []
+    return hits
+
+
+def _scan_file(
+    fp: str, fsize: int, rx: re.Pattern, rx_doc: re.Pattern, needle: Optional[bytes], limit: int,
+) -> List[str]:
+    """Search one file, returning "path:line:text" hits.
+
+    The whole file is searched with the multiline pattern `rx_doc`, so Python
+    only touches lines around candidate matches; each candidate line is then
+    confirmed with the line pattern `rx` to keep per-line grep semantics.
+    """
+    if needle is not None and fsize > _MMAP_THRESHOLD:
+        return _scan_mapped(fp, needle, limit)
+    hits: List[str] = []
+    try:
+        with open(fp, "r", errors="ignore") as f:
+            data = f.read()
+    except Exception:
+        return hits
+    size = len(data)
+    display = None
+    ln_no = 1
+    counted = 0
+    pos = 0
+    while pos < size:
+        m = rx_doc.search(data, pos)
+        if m is None:
+            break
+        start = m.start()
+        nl = data.rfind("\n", pos, start)
+        line_start = pos if nl < 0 else nl + 1
+        if line_start >= size:
+            break
+        line_end = data.find("\n", start)
+        if line_end < 0:
+            line_end = size
+        ln_no += data.count("\n", counted, line_start)
+        counted = line_start
+        line = data[line_start:line_end + 1]
+        if _line_matches(rx, line):
+            if display is None:
+                display = to_display_path(fp)
+            hits.append(f"{display}:{ln_no}:{_clip_line(line.rstrip())}")
+            if len(hits) >= limit:
+                break
+        pos = line_end + 1
+    return hits
+
+
+def _iter_files(root: str) -> Iterator[Tuple[str, int]]:
+    """Yield (path, size) for files under root, skipping DEFAULT_IGNORE_DIRS.
+
+    Walks with os.scandir so the file type comes from the cached DirEntry;
+    order matches a top-down os.walk. Symlinked directories are not followed.
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        subdirs: List[str] = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if entry.name not in DEFAULT_IGNORE_DIRS and not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            yield entry.path, size
+        stack.extend(reversed(subdirs))
+
+
+def _fallback_scan(
+    path: str, pat: str, literal: bool, include: Optional[str], limit: int,
+) -> Tuple[List[str], bool]:
+    """Pure-Python grep used when rg is unavailable.
+
+    Files are searched on a thread pool as the walk discovers them, so file
+    reads (which release the GIL) overlap with matching. Only a bounded
+    window of scans is in flight; results are collected in walk order and
+    the walk stops as soon as `limit` hits are in.
+    Raises re.error for an invalid pattern. Returns (hits, scan_truncated).
+    """
+    rx = _get_pattern(pat, literal)
+    rx_doc = _get_pattern(pat, literal, multiline=True)
+    needle = _literal_needle(pat, literal)
+    if os.path.isfile(path):
+        try:
+            fsize = os.path.getsize(path)
+        except OSError:
+            return [], False
+        if fsize > MAX_SINGLE_FILE_SCAN:
+            return [], False
+        return _scan_file(path, fsize, rx, rx_doc, needle, limit), False
+
+    include_re = None
+    include_globs = _include_globs(include)
+    if include_globs:
+        include_re = re.compile("|".join(fnmatch.translate(g) for g in include_globs))
+    hits: List[str] = []
+    scanned_bytes = 0
+    scan_truncated = False
+    submitted = 0
+    pending: Deque[Future] = deque()
+    pool = ThreadPoolExecutor(max_workers=_SCAN_WORKERS)
+    try:
+        for fp, fsize in _iter_files(path):
+            if _is_ignored_path(fp):
+                continue
+            if include_re is not None and not include_re.match(os.path.basename(fp)):
+                continue
+            if submitted >= _MAX_SCAN_FILES or scanned_bytes >= _MAX_SCAN_BYTES:
+                scan_truncated = True
+                break
+            if fsize > MAX_SINGLE_FILE_SCAN:
+                continue
+            scanned_bytes += fsize
+            submitted += 1
+            pending.append(pool.submit(_scan_file, fp, fsize, rx, rx_doc, needle, limit))
+            if len(pending) >= _SCAN_WINDOW:
+                hits.extend(pending.popleft().result())
+                if len(hits) >= limit:
+                    break
+        while pending and len(hits) < limit:
+            hits.extend(pending.popleft().result())
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return hits[:limit], scan_truncated
 
 
 def _tool_hints_enabled() -> bool:
@@ -45,6 +389,20 @@ def _tool_hints_enabled() -> bool:
     return raw not in {"0", "false", "no", "off"}
 
 
+def _sort_newest_first(files: List[str]) -> List[str]:
+    """Sort files by mtime, newest first (non-files last), with one stat per path."""
+    keyed: List[Tuple[float, str]] = []
+    for fp in files:
+        try:
+            st = os.stat(fp)
+            mtime = st.st_mtime if stat.S_ISREG(st.st_mode) else 0
+        except OSError:
+            mtime = 0
+        keyed.append((mtime, fp))
+    keyed.sort(key=itemgetter(0), reverse=True)
+    return [fp for _, fp in keyed]
+
+
 def glob_fn(args: Any) -> str:
     args, err = _require_args_dict(args, "glob")
     if err:
@@ -60,24 +418,12 @@ def glob_fn(args: Any) -> str:
     if not os.path.isdir(path):
         return f"error: path does not exist: {display_path}"
 
-    def _safe_mtime(fp: str) -> float:
-        try:
-            return os.path.getmtime(fp) if os.path.isfile(fp) else 0
-        except OSError:
-            return 0
-
-    if shutil.which("rg"):
-        cmd = ["rg", "--files", "-g", str(pat), path]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode in (0, 1):
-            files = [ln.strip() for ln in result.stdout.splitlines() if ln.strip()]
-            files = [f for f in files if not _is_ignored_path(f)]
-            if len(files) <= 200:
-                files.sort(key=_safe_mtime, reverse=True)
-            else:
-                files.sort()
-            truncated = len(files) > MAX_GLOB_RESULTS
-            files = files[:MAX_GLOB_RESULTS]
+    if _RG_PATH:
+        # --sortr=modified: rg returns newest files first, no Python-side stat calls.
+        cmd = [_RG_PATH, "--files", "--sortr=modified", "-g", str(pat), *_rg_filter_args(), path]
+        streamed = _run_rg(cmd, MAX_GLOB_RESULTS, _parse_file_line)
+        if streamed is not None:
+            files, truncated = streamed
             if not files:
                 return "no files found"
             display_files = [to_display_path(f) for f in files]
@@ -92,7 +438,7 @@ def glob_fn(args: Any) -> str:
     files = globlib.glob(pattern, recursive=True)
     files = [f for f in files if not _is_ignored_path(f)]
     if len(files) <= 200:
-        files.sort(key=_safe_mtime, reverse=True)
+        files = _sort_newest_first(files)
     else:
         files.sort()
     truncated = len(files) > MAX_GLOB_RESULTS
@@ -110,26 +456,16 @@ def glob_fn(args: Any) -> str:
 
 def _glob_next_step_hint(files: list) -> str:
     """Return an optional neutral hint after file discovery."""
-    spec_files = [f for f in files if f.endswith(('.spec.js', '.test.js'))]
-    if spec_files:
-        return f"\n\nHint: tests were found (e.g. {spec_files[0]}). Read relevant files as needed."
+    first_spec = next((f for f in files if f.endswith(('.spec.js', '.test.js'))), None)
+    if first_spec:
+        return f"\n\nHint: tests were found (e.g. {first_spec}). Read relevant files as needed."
     return ""
 
 
-def grep_fn(args: Any) -> str:
-    args, err = _require_args_dict(args, "grep")
-    if err:
-        return err
-    pat = args.get("pat")
-    if not pat or not isinstance(pat, str):
-        return "error: pat (pattern) is required"
-    path = args.get("path", ".") or "."
-    include = args.get("include")
-    literal_text_raw = args.get("literal_text", False)
-    if literal_text_raw is not None and not isinstance(literal_text_raw, bool):
-        return "error: literal_text must be boolean"
-    literal_text = bool(literal_text_raw)
-
+def _search_path(
+    pattern: str, path: str, include: Optional[str], literal_text: bool, limit: int,
+) -> str:
+    """Shared body of grep_fn and search_fn once their arguments are validated."""
     try:
         if _state.SANDBOX_ROOT:
             path = _validate_path(path, check_exists=True)
@@ -142,20 +478,15 @@ def grep_fn(args: Any) -> str:
     if not os.path.exists(path):
         return f"error: path does not exist: {display_path}"
 
-    if shutil.which("rg"):
-        cmd = ["rg", "--line-number", "--no-heading", "--color", "never"]
+    if _RG_PATH:
+        cmd = [_RG_PATH, "--json", "--max-count", str(limit + 1)]
         if literal_text:
             cmd.append("-F")
-        if include:
-            cmd.extend(["--glob", str(include)])
-        cmd.extend(["--", pat, path])
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode in (0, 1):
-            lines = [ln for ln in result.stdout.splitlines() if ln.strip()]
-            lines = [ln for ln in lines if not _is_ignored_path(_extract_hit_path(ln))]
-            lines = [_render_hit_line(ln) for ln in lines]
-            truncated = len(lines) > MAX_GREP_RESULTS
-            lines = lines[:MAX_GREP_RESULTS]
+        cmd.extend(_rg_filter_args(include))
+        cmd.extend(["--", pattern, path])
+        streamed = _run_rg(cmd, limit, _parse_json_hit)
+        if streamed is not None:
+            lines, truncated = streamed
             if not lines:
                 return "no matches found"
             out = "\n".join(lines)
@@ -164,62 +495,39 @@ def grep_fn(args: Any) -> str:
             return out
 
     try:
-        rx = re.compile(re.escape(pat) if literal_text else pat)
+        hits, scan_truncated = _fallback_scan(path, pattern, literal_text, include, limit)
     except re.error as e:
         return f"error: invalid regex: {e}"
 
-    hits: List[str] = []
-    scanned_files = 0
-    scanned_bytes = 0
-    MAX_SCAN_FILES = 2000
-    MAX_SCAN_BYTES = 50 * 1024 * 1024  # 50MB
-    if os.path.isfile(path):
-        file_list = [path]
-    else:
-        file_list = []
-        for root, dirs, files in os.walk(path):
-            dirs[:] = [d for d in dirs if d not in DEFAULT_IGNORE_DIRS]
-            for name in files:
-                file_list.append(os.path.join(root, name))
-
-    scan_truncated = False
-    for fp in file_list:
-        if _is_ignored_path(fp):
-            continue
-        if include and not fnmatch.fnmatch(os.path.basename(fp), str(include)):
-            continue
-        if scanned_files >= MAX_SCAN_FILES or scanned_bytes >= MAX_SCAN_BYTES:
-            scan_truncated = True
-            break
-        try:
-            fsize = os.path.getsize(fp)
-            if fsize > MAX_SINGLE_FILE_SCAN:
-                continue
-            scanned_bytes += fsize
-            scanned_files += 1
-            with open(fp, "r", errors="ignore") as f:
-                for ln_no, ln in enumerate(f, 1):
-                    if rx.search(ln):
-                        hits.append(f"{to_display_path(fp)}:{ln_no}:{ln.rstrip()}")
-                        if len(hits) >= MAX_GREP_RESULTS:
-                            break
-        except Exception:
-            pass
-        if len(hits) >= MAX_GREP_RESULTS:
-            break
-
     if not hits:
         if scan_truncated:
             return "no matches found (scan limit reached; install ripgrep for better performance)"
         return "no matches found"
     out = "\n".join(hits)
-    if len(hits) >= MAX_GREP_RESULTS:
+    if len(hits) >= limit:
         out += "\n\n(results are truncated; refine path or include pattern)"
     elif scan_truncated:
         out += "\n\n(scan limit reached; install ripgrep for better performance)"
     return out
 
 
+def grep_fn(args: Any) -> str:
+    args, err = _require_args_dict(args, "grep")
+    if err:
+        return err
+    pat = args.get("pat")
+    if not pat or not isinstance(pat, str):
+        return "error: pat (pattern) is required"
+    path = args.get("path", ".") or "."
+    include = args.get("include")
+    literal_text_raw = args.get("literal_text", False)
+    if literal_text_raw is not None and not isinstance(literal_text_raw, bool):
+        return "error: literal_text must be boolean"
+    literal_text = bool(literal_text_raw)
+
+    return _search_path(pat, path, include, literal_text, MAX_GREP_RESULTS)
+
+
 def search_fn(args: Any) -> str:
     args, err = _require_args_dict(args, "search")
     if err:
@@ -246,94 +554,26 @@ def search_fn(args: Any) -> str:
             return "error: max_results must be positive"
         max_results_int = min(max_results_int, MAX_GREP_RESULTS)
 
-    try:
-        if _state.SANDBOX_ROOT:
-            path = _validate_path(path, check_exists=True)
-        else:
-            path = os.path.abspath(path)
-    except ValueError as e:
-        return f"error: {e}"
-    display_path = to_display_path(path)
+    return _search_path(pattern, path, include, literal_text, max_results_int)
 
-    if not os.path.exists(path):
-        return f"error: path does not exist: {display_path}"
 
-    if shutil.which("rg"):
-        cmd = ["rg", "--line-number", "--no-heading", "--color", "never"]
-        if literal_text:
-            cmd.append("-F")
-        if include:
-            cmd.extend(["--glob", str(include)])
-        cmd.extend(["--", pattern, path])
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode in (0, 1):
-            lines = [ln for ln in result.stdout.splitlines() if ln.strip()]
-            lines = [ln for ln in lines if not _is_ignored_path(_extract_hit_path(ln))]
-            lines = [_render_hit_line(ln) for ln in lines]
-            truncated = len(lines) > max_results_int
-            lines = lines[:max_results_int]
-            if not lines:
-                return "no matches found"
-            out = "\n".join(lines)
-            if truncated:
-                out += "\n\n(results are truncated; refine path or include pattern)"
-            return out
+# Directory mtimes have coarse (tick-level) resolution, so a listing is only
+# cached once the directory has been unmodified for this long.
+_LS_CACHE_MIN_AGE_NS = 2 * 1_000_000_000
 
-    try:
-        rx = re.compile(re.escape(pattern) if literal_text else pattern)
-    except re.error as e:
-        return f"error: invalid regex: {e}"
 
-    hits: List[str] = []
-    scanned_files = 0
-    scanned_bytes = 0
-    MAX_SCAN_FILES = 2000
-    MAX_SCAN_BYTES = 50 * 1024 * 1024  # 50MB
-    if os.path.isfile(path):
-        file_list = [path]
-    else:
-        file_list = []
-        for root, dirs, files in os.walk(path):
-            dirs[:] = [d for d in dirs if d not in DEFAULT_IGNORE_DIRS]
-            for name in files:
-                file_list.append(os.path.join(root, name))
+@functools.lru_cache(maxsize=64)
+def _scandir_names(path: str, mtime_ns: int) -> Tuple[str, ...]:
+    with os.scandir(path) as it:
+        return tuple(sorted(entry.name for entry in it))
 
-    scan_truncated = False
-    for fp in file_list:
-        if _is_ignored_path(fp):
-            continue
-        if include and not fnmatch.fnmatch(os.path.basename(fp), str(include)):
-            continue
-        if scanned_files >= MAX_SCAN_FILES or scanned_bytes >= MAX_SCAN_BYTES:
-            scan_truncated = True
-            break
-        try:
-            fsize = os.path.getsize(fp)
-            if fsize > MAX_SINGLE_FILE_SCAN:
-                continue
-            scanned_bytes += fsize
-            scanned_files += 1
-            with open(fp, "r", errors="ignore") as f:
-                for ln_no, ln in enumerate(f, 1):
-                    if rx.search(ln):
-                        hits.append(f"{to_display_path(fp)}:{ln_no}:{ln.rstrip()}")
-                        if len(hits) >= max_results_int:
-                            break
-        except Exception:
-            pass
-        if len(hits) >= max_results_int:
-            break
 
-    if not hits:
-        if scan_truncated:
-            return "no matches found (scan limit reached; install ripgrep for better performance)"
-        return "no matches found"
-    out = "\n".join(hits)
-    if len(hits) >= max_results_int:
-        out += "\n\n(results are truncated; refine path or include pattern)"
-    elif scan_truncated:
-        out += "\n\n(scan limit reached; install ripgrep for better performance)"
-    return out
+def _list_dir(path: str) -> Tuple[str, ...]:
+    """Sorted entry names of `path`, reused while the directory mtime is unchanged."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    if time.time_ns() - mtime_ns < _LS_CACHE_MIN_AGE_NS:
+        return _scandir_names.__wrapped__(path, mtime_ns)
+    return _scandir_names(path, mtime_ns)
 
 
 def ls_fn(args: Any) -> str:
@@ -354,7 +594,7 @@ def ls_fn(args: Any) -> str:
         return f"error: directory not found: {display_path}"
 
     try:
-        entries = sorted(os.listdir(path))
+        entries = _list_dir(path)
     except PermissionError:
         return f"error: permission denied: {display_path}"
     except OSError:
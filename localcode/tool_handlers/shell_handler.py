@@ -2,21 +2,25 @@
 Shell command tool handler: shell() and helpers.
 """
 
+import codecs
 import json
+import locale
 import os
-import shlex
+import selectors
 import subprocess
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from collections import ChainMap, deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
 
 from localcode.tool_handlers import _state
 from localcode.tool_handlers._state import (
     DEFAULT_SHELL_TIMEOUT_MS,
     MAX_SHELL_OUTPUT_CHARS,
     MAX_SHELL_TIMEOUT_MS,
+    _SPEC_SEARCH_RESULTS,
     _require_args_dict,
 )
-from localcode.tool_handlers._path import _is_path_within_sandbox, to_display_path
+from localcode.tool_handlers._path import _is_path_within_sandbox, _walk_for_file, to_display_path
 from localcode.tool_handlers._sandbox import (
     TEST_MENTION_RE,
     _ENV_VAR_ASSIGN_RE,
@@ -24,16 +28,104 @@ from localcode.tool_handlers._sandbox import (
     _SHELL_CHAINING_RE,
     _check_dangerous_command,
     _check_sandbox_allowlist,
+    _split_command,
 )
 
 
-def _truncate_shell_output(text: str) -> str:
-    if len(text) <= MAX_SHELL_OUTPUT_CHARS:
+# Head/tail split of truncated shell output.
+_OUTPUT_HEAD_CHARS = MAX_SHELL_OUTPUT_CHARS // 2
+_OUTPUT_TAIL_CHARS = MAX_SHELL_OUTPUT_CHARS - _OUTPUT_HEAD_CHARS
+
+
+# Bytes kept from each end of a stream while a command runs. 4 bytes per
+# char covers any UTF-8 text, so truncation never reaches the dropped middle.
+_CAPTURE_EDGE_BYTES = 4 * MAX_SHELL_OUTPUT_CHARS
+_READ_CHUNK = 65536
+
+
+def _truncate_shell_output(text: str, omitted: int = 0) -> str:
+    """Keep the head and tail of `text`; `omitted` counts output already dropped while capturing."""
+    size = len(text)
+    if size <= MAX_SHELL_OUTPUT_CHARS:
         return text
-    head_len = MAX_SHELL_OUTPUT_CHARS // 2
-    tail_len = MAX_SHELL_OUTPUT_CHARS - head_len
-    removed = len(text) - MAX_SHELL_OUTPUT_CHARS
-    return f"{text[:head_len]}\n...[truncated {removed} chars]...\n{text[-tail_len:]}"
+    removed = size - MAX_SHELL_OUTPUT_CHARS + omitted
+    return f"{text[:_OUTPUT_HEAD_CHARS]}\n...[truncated {removed} chars]...\n{text[size - _OUTPUT_TAIL_CHARS:]}"
+
+
+class _CappedStream:
+    """Keeps the first and last _CAPTURE_EDGE_BYTES of a stream, counting what is dropped.
+
+    `dropped` counts characters, not bytes: dropped chunks are run through an
+    incremental decoder so it matches the char counts used when truncating.
+    """
+
+    __slots__ = ("head", "tail", "tail_size", "dropped", "_decoder")
+
+    def __init__(self) -> None:
+        self.head = bytearray()
+        self.tail: Deque[bytes] = deque()
+        self.tail_size = 0
+        self.dropped = 0
+        self._decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+
+    def feed(self, chunk: bytes) -> None:
+        room = _CAPTURE_EDGE_BYTES - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if not chunk:
+            return
+        self.tail.append(chunk)
+        self.tail_size += len(chunk)
+        while self.tail_size - len(self.tail[0]) >= _CAPTURE_EDGE_BYTES:
+            old = self.tail.popleft()
+            self.tail_size -= len(old)
+            dropped = self._decoder.decode(old)
+            self.dropped += len(dropped) - dropped.count("\r\n")
+
+    def text(self) -> str:
+        data = bytes(self.head) + b"".join(self.tail)
+        text = data.decode(locale.getpreferredencoding(False), errors="replace")
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _run_capped(
+    cmd_args: List[str], cwd: str, env: Optional[Mapping[str, str]], timeout_sec: int,
+) -> Tuple[int, _CappedStream, _CappedStream]:
+    """Run a command, streaming stdout/stderr into bounded buffers.
+
+    Memory stays constant however much the command prints. Raises
+    subprocess.TimeoutExpired (after killing the process) on timeout.
+    """
+    deadline = time.monotonic() + timeout_sec
+    # Keep the spawn kwargs minimal (no preexec_fn, start_new_session, pass_fds,
+    # user/group): CPython then launches the child with vfork() instead of
+    # fork(), avoiding a page-table copy of this large parent process.
+    # (posix_spawn itself is never used when cwd= is set.)
+    with subprocess.Popen(
+        cmd_args, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env,
+    ) as proc:
+        streams = {proc.stdout: _CappedStream(), proc.stderr: _CappedStream()}
+        with selectors.DefaultSelector() as sel:
+            for pipe in streams:
+                sel.register(pipe, selectors.EVENT_READ)
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    proc.kill()
+                    raise subprocess.TimeoutExpired(cmd_args, timeout_sec)
+                for key, _ in sel.select(timeout=remaining):
+                    chunk = os.read(key.fd, _READ_CHUNK)
+                    if chunk:
+                        streams[key.fileobj].feed(chunk)
+                    else:
+                        sel.unregister(key.fileobj)
+        try:
+            returncode = proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise
+    return int(returncode), streams[proc.stdout], streams[proc.stderr]
 
 
 def _shell_payload(output: str, exit_code: int, duration_seconds: float, timed_out: bool = False) -> str:
@@ -71,6 +163,7 @@ def shell(args: Any) -> str:
     if TEST_MENTION_RE.search(command):
         return _shell_payload("error: test commands are not allowed; tests run automatically after completion.", 1, 0.0)
 
+    # Dangerous patterns apply in every mode; the remaining checks are sandbox-only.
     dangerous = _check_dangerous_command(command)
     if dangerous:
         return _shell_payload("error: command blocked by sandbox (matched dangerous pattern)", 1, 0.0)
@@ -101,47 +194,45 @@ def shell(args: Any) -> str:
     timeout_sec = max(1, int(timeout_ms_int / 1000))
 
     try:
-        cmd_args = shlex.split(command)
+        cmd_args = _split_command(command)
     except ValueError as e:
         return _shell_payload(f"error: failed to parse command: {e}", 1, 0.0)
 
-    # Extract leading VAR=val assignments into env dict so they work with shell=False
-    env: Optional[Dict[str, str]] = None
+    # Extract leading VAR=val assignments into env overrides so they work with shell=False.
+    # Popen encodes the mapping itself, so os.environ is layered rather than copied.
+    env: Optional[Mapping[str, str]] = None
     cmd_start = 0
     while cmd_start < len(cmd_args) and _ENV_VAR_ASSIGN_RE.match(cmd_args[cmd_start]):
         cmd_start += 1
     if cmd_start > 0:
-        env = dict(os.environ)
+        overrides: Dict[str, str] = {}
         for token in cmd_args[:cmd_start]:
             key, _, val = token.partition("=")
-            env[key] = val
+            overrides[key] = val
+        env = ChainMap(overrides, os.environ)
         cmd_args = cmd_args[cmd_start:]
     if not cmd_args:
         return _shell_payload("error: command contains only variable assignments, no actual command", 1, 0.0)
 
+    # The command may create or remove files the path auto-correction and
+    # spec lookup have cached.
+    _walk_for_file.cache_clear()
+    _SPEC_SEARCH_RESULTS.clear()
     start = time.time()
     try:
-        result = subprocess.run(
-            cmd_args,
-            shell=False,
-            capture_output=True,
-            text=True,
-            timeout=timeout_sec,
-            cwd=workdir_real,
-            env=env,
-        )
+        returncode, stdout_buf, stderr_buf = _run_capped(cmd_args, workdir_real, env, timeout_sec)
         dur = round(time.time() - start, 1)
-        stdout = (result.stdout or "").strip()
-        stderr = (result.stderr or "").strip()
+        stdout = stdout_buf.text().strip()
+        stderr = stderr_buf.text().strip()
         parts = []
         if stdout:
             parts.append(stdout)
         if stderr:
             parts.append(f"[stderr]\n{stderr}")
         out = "\n".join(parts) if parts else "(empty output)"
-        out = _truncate_shell_output(out)
-        return _shell_payload(out, int(result.returncode), dur)
-    except subprocess.TimeoutExpired as exc:
+        out = _truncate_shell_output(out, omitted=stdout_buf.dropped + stderr_buf.dropped)
+        return _shell_payload(out, returncode, dur)
+    except subprocess.TimeoutExpired:
         dur = round(time.time() - start, 1)
         out = f"command timed out after {timeout_ms_int} milliseconds"
         return _shell_payload(out, 124, dur, timed_out=True)
@@ -2,14 +2,19 @@
 File writing tool handlers: write(), edit().
 """
 
+import atexit
 import os
 import hashlib
 import difflib
+import functools
+import itertools
 import json
 import re
+import select
 import subprocess
-import tempfile
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 # === EDIT STRATEGY CONFIG ===
 # V1: stealth (all "ok"), V2: rich_noop, V3: rich_noop_short,
@@ -21,16 +26,28 @@ from localcode.tool_handlers import _state as _state_mod
 from localcode.tool_handlers._state import (
     FILE_VERSIONS,
     WRITTEN_PATHS,
+    _DIGEST_CACHE,
     _NOOP_COUNTS,
+    _NoopCounts,
+    _NOOP_WRITE_COUNTS,
+    _SPEC_SEARCH_RESULTS,
+    _WRITTEN_STATS,
+    _cached_newline_count,
     _mutation_brief_line,
     _mutation_decision_hint,
     _mutation_state_line,
+    _normalize_newlines,
     _record_mutation,
     _require_args_dict,
     _short_sha_text,
+    _stat_signature,
     _track_file_version,
+    _trim_common,
+    _write_fd,
+    _write_file_bytes,
 )
 from localcode.tool_handlers._path import (
+    _IGNORE_DIR_SET,
     _find_file_in_sandbox,
     _should_block_test_edit,
     _validate_path,
@@ -38,67 +55,69 @@ from localcode.tool_handlers._path import (
 )
 
 
+# Parsed LOCALCODE_* boolean flags. The environment is fixed for a CLI run,
+# so each flag is resolved on first use; call _refresh_flags() after changing it.
+_FLAG_CACHE: Dict[str, bool] = {}
+_FALSE_VALUES = frozenset({"0", "false", "no", "off"})
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    try:
+        return _FLAG_CACHE[name]
+    except KeyError:
+        pass
+    raw = str(os.environ.get(name, "")).strip().lower()
+    value = default if not raw else raw not in _FALSE_VALUES
+    _FLAG_CACHE[name] = value
+    return value
+
+
+def _refresh_flags() -> None:
+    _FLAG_CACHE.clear()
+
+
 def _tool_hints_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_TOOL_HINTS", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_TOOL_HINTS", False)
 
 
 def _inject_tests_on_write_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_INJECT_TESTS_ON_WRITE", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_INJECT_TESTS_ON_WRITE", False)
 
 
 def _enforce_read_before_write_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_ENFORCE_READ_BEFORE_WRITE", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_ENFORCE_READ_BEFORE_WRITE", False)
 
 
 def _edit_success_snippet_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_EDIT_SNIPPET_SUCCESS", "")).strip().lower()
-    if not raw:
-        return True
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_EDIT_SNIPPET_SUCCESS", True)
 
 
 def _write_success_snippet_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_WRITE_SNIPPET_SUCCESS", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_WRITE_SNIPPET_SUCCESS", False)
 
 
 def _write_spec_focus_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_WRITE_SPEC_FOCUS", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_WRITE_SPEC_FOCUS", False)
 
 
 def _write_spec_contract_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_WRITE_SPEC_CONTRACT", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_WRITE_SPEC_CONTRACT", False)
 
 
 def _edit_verbose_state_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_EDIT_VERBOSE_STATE", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_EDIT_VERBOSE_STATE", False)
 
 
 def _write_verbose_state_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_WRITE_VERBOSE_STATE", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_WRITE_VERBOSE_STATE", False)
+
+
+def _write_atomic_enabled() -> bool:
+    return _env_flag("LOCALCODE_WRITE_ATOMIC", False)
+
+
+def _write_durable_enabled() -> bool:
+    return _env_flag("LOCALCODE_WRITE_DURABLE", False)
 
 
 def _write_full_drop_fields() -> set[str]:
@@ -128,10 +147,7 @@ def _is_default_write_decision_hint(decision_hint: str) -> bool:
 
 
 def _edit_hash_anchor_enabled() -> bool:
-    raw = str(os.environ.get("LOCALCODE_EDIT_HASH_ANCHOR", "")).strip().lower()
-    if not raw:
-        return False
-    return raw not in {"0", "false", "no", "off"}
+    return _env_flag("LOCALCODE_EDIT_HASH_ANCHOR", False)
 
 
 def _snippet_style() -> str:
@@ -192,10 +208,22 @@ _UNICODE_TRANSLATION_TABLE = str.maketrans({
 })
 
 
+# Every mapping is one character to one ASCII character, so a character
+# class sub gives the same result as str.translate. translate does a dict
+# lookup for every code point (~100ms/MB). The regex only calls back on
+# actual hits, and ASCII text, which has nothing to map, is returned as is.
+_UNICODE_MATCH_MAP = {chr(code): repl for code, repl in _UNICODE_TRANSLATION_TABLE.items()}
+_UNICODE_MATCH_RE = re.compile("[" + "".join(map(re.escape, _UNICODE_MATCH_MAP)) + "]")
+
+
+def _unicode_match_replacement(match: re.Match) -> str:
+    return _UNICODE_MATCH_MAP[match.group()]
+
+
 def _normalize_unicode_for_match(text: str) -> str:
-    if not text:
+    if not text or text.isascii():
         return text
-    return text.translate(_UNICODE_TRANSLATION_TABLE)
+    return _UNICODE_MATCH_RE.sub(_unicode_match_replacement, text)
 
 
 def _strip_single_trailing_newline(text: str) -> str:
@@ -206,56 +234,89 @@ def _strip_single_trailing_newline(text: str) -> str:
     return text
 
 
-def _find_unique_unicode_slice(text: str, needle: str) -> Optional[str]:
-    normalized_text = _normalize_unicode_for_match(text)
+def _find_unique_unicode_slice(
+    text: str,
+    needle: str,
+    normalized_text: Optional[str] = None,
+) -> Optional[str]:
+    if normalized_text is None:
+        normalized_text = _normalize_unicode_for_match(text)
     normalized_needle = _normalize_unicode_for_match(needle)
     if not normalized_needle:
         return None
-    positions: List[int] = []
-    start = 0
-    while len(positions) < 2:
-        idx = normalized_text.find(normalized_needle, start)
-        if idx < 0:
-            break
-        positions.append(idx)
-        start = idx + 1
-    if len(positions) != 1:
+    pos = normalized_text.find(normalized_needle)
+    if pos < 0:
+        return None
+    # Resume past the whole first hit: uniqueness is judged on
+    # non-overlapping occurrences, as edit()'s own count/split does.
+    if normalized_text.find(normalized_needle, pos + len(normalized_needle)) >= 0:
         return None
-    pos = positions[0]
     return text[pos: pos + len(needle)]
 
 
+def _split_noeol(text: str) -> List[str]:
+    """Lines of *text* without their "\n"/"\r\n" terminators."""
+    lines = text.split("\n")
+    if lines[-1] == "":
+        # A trailing newline (or empty text) does not start another line.
+        lines.pop()
+    if "\r" in text:
+        lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+    return lines
+
+
 def _find_unique_line_window_slice(
     text: str,
     needle: str,
     transform,
+    hay_cache: Optional[Dict[Any, List[Any]]] = None,
 ) -> Optional[str]:
-    haystack_lines = text.splitlines(keepends=True)
-    needle_lines = needle.splitlines(keepends=True)
-    if not haystack_lines or not needle_lines:
+    # hay_cache lets repeated calls on the same text share the split
+    # haystack ("noeol"/"offsets") and its per-transform normalized lines.
+    if hay_cache is None:
+        hay_cache = {}
+    hay_noeol = hay_cache.get("noeol")
+    if hay_noeol is None:
+        hay_noeol = hay_cache["noeol"] = _split_noeol(text)
+    needle_noeol = _split_noeol(needle)
+    if not hay_noeol or not needle_noeol:
         return None
-    if len(needle_lines) > len(haystack_lines):
+    if len(needle_noeol) > len(hay_noeol):
         return None
 
-    hay_noeol = [line.rstrip("\r\n") for line in haystack_lines]
-    needle_noeol = [line.rstrip("\r\n") for line in needle_lines]
-
-    normalized_hay = [transform(line) for line in hay_noeol]
+    normalized_hay = hay_cache.get(transform)
+    if normalized_hay is None:
+        normalized_hay = hay_cache[transform] = [transform(line) for line in hay_noeol]
     normalized_needle = [transform(line) for line in needle_noeol]
     window = len(normalized_needle)
 
+    # Sieve on the first line with list.index (a C-level scan); the rest of
+    # the window is only compared where that line already matches.
+    first_line = normalized_needle[0]
+    rest = normalized_needle[1:]
+    stop = len(normalized_hay) - window + 1
     matches: List[int] = []
-    for idx in range(len(normalized_hay) - window + 1):
-        if normalized_hay[idx: idx + window] == normalized_needle:
+    idx = -1
+    while True:
+        try:
+            idx = normalized_hay.index(first_line, idx + 1, stop)
+        except ValueError:
+            break
+        if normalized_hay[idx + 1: idx + window] == rest:
             matches.append(idx)
             if len(matches) > 1:
                 return None
     if not matches:
         return None
 
+    # Start offset of each line; only built once a unique match needs slicing.
+    offsets = hay_cache.get("offsets")
+    if offsets is None:
+        offsets = hay_cache["offsets"] = list(
+            itertools.accumulate((len(line) + 1 for line in text.split("\n")), initial=0)
+        )
     first = matches[0]
-    selected = haystack_lines[first: first + window]
-    canonical = "".join(selected)
+    canonical = text[offsets[first]:offsets[first + window]]
     if not needle.endswith(("\n", "\r")):
         canonical = _strip_single_trailing_newline(canonical)
     return canonical
@@ -312,6 +373,18 @@ def _find_unique_anchor_window_slice(text: str, needle: str) -> Optional[str]:
     return canonical
 
 
+def _line_exact(value: str) -> str:
+    return value
+
+
+def _line_rstrip(value: str) -> str:
+    return value.rstrip()
+
+
+def _line_unicode_rstrip(value: str) -> str:
+    return _normalize_unicode_for_match(value).rstrip()
+
+
 def _resolve_old_text(text: str, old: str) -> Optional[str]:
     if old in text:
         return old
@@ -321,29 +394,41 @@ def _resolve_old_text(text: str, old: str) -> Optional[str]:
     if trimmed and trimmed != old:
         candidates.append(trimmed)
 
+    # The haystack is normalized and split once, then shared by both
+    # candidates and all three line-window transforms.
+    text_ascii = text.isascii()
+    normalized_text = text if text_ascii else _normalize_unicode_for_match(text)
+    hay_cache: Dict[Any, List[str]] = {}
     for candidate in candidates:
-        if candidate in text:
+        # `old` itself was already searched for above.
+        if candidate is not old and candidate in text:
             return candidate
 
-        unicode_slice = _find_unique_unicode_slice(text, candidate)
-        if unicode_slice is not None:
-            return unicode_slice
+        # The translation table only maps non-ASCII characters: with both
+        # sides ASCII the Unicode passes repeat the exact and rstrip ones.
+        plain = text_ascii and candidate.isascii()
+        if not plain:
+            unicode_slice = _find_unique_unicode_slice(text, candidate, normalized_text)
+            if unicode_slice is not None:
+                return unicode_slice
 
-        line_exact = _find_unique_line_window_slice(text, candidate, lambda value: value)
+        line_exact = _find_unique_line_window_slice(text, candidate, _line_exact, hay_cache)
         if line_exact is not None:
             return line_exact
 
-        line_trimmed = _find_unique_line_window_slice(text, candidate, lambda value: value.rstrip())
+        line_trimmed = _find_unique_line_window_slice(text, candidate, _line_rstrip, hay_cache)
         if line_trimmed is not None:
             return line_trimmed
 
-        line_unicode_trimmed = _find_unique_line_window_slice(
-            text,
-            candidate,
-            lambda value: _normalize_unicode_for_match(value).rstrip(),
-        )
-        if line_unicode_trimmed is not None:
-            return line_unicode_trimmed
+        if not plain:
+            line_unicode_trimmed = _find_unique_line_window_slice(
+                text,
+                candidate,
+                _line_unicode_rstrip,
+                hay_cache,
+            )
+            if line_unicode_trimmed is not None:
+                return line_unicode_trimmed
 
         if _edit_hash_anchor_enabled():
             anchor_window = _find_unique_anchor_window_slice(text, candidate)
@@ -358,12 +443,14 @@ def _build_edit_region_snippet(
     current: str,
     context_lines: int = 4,
     max_changed_lines: int = 1000,
+    bundle: Optional[Dict[str, Any]] = None,
 ) -> Optional[Dict[str, Any]]:
     if previous == current:
         return None
 
-    prev_lines = previous.splitlines()
-    curr_lines = current.splitlines()
+    if bundle is None:
+        bundle = _diff_bundle(previous, current)
+    curr_lines = bundle["curr_lines"]
     total_lines = len(curr_lines)
     if total_lines == 0:
         return {
@@ -374,19 +461,9 @@ def _build_edit_region_snippet(
             "too_large": False,
         }
 
-    first_diff = 0
-    limit = min(len(prev_lines), len(curr_lines))
-    while first_diff < limit and prev_lines[first_diff] == curr_lines[first_diff]:
-        first_diff += 1
-
-    prev_idx = len(prev_lines) - 1
-    curr_idx = len(curr_lines) - 1
-    while prev_idx >= first_diff and curr_idx >= first_diff and prev_lines[prev_idx] == curr_lines[curr_idx]:
-        prev_idx -= 1
-        curr_idx -= 1
-
-    changed_start = first_diff
-    changed_end = max(changed_start, curr_idx)
+    # The bundle has already trimmed the lines shared at both ends.
+    changed_start = bundle["prefix"]
+    changed_end = max(changed_start, changed_start + len(bundle["curr_mid"]) - 1)
     changed_count = changed_end - changed_start + 1
 
     if changed_count > max_changed_lines:
@@ -414,8 +491,13 @@ def _build_edit_region_snippet(
     }
 
 
-def _append_region_snippet(lines: List[str], previous: str, current: str) -> bool:
-    snippet = _build_edit_region_snippet(previous, current)
+def _append_region_snippet(
+    lines: List[str],
+    previous: str,
+    current: str,
+    bundle: Optional[Dict[str, Any]] = None,
+) -> bool:
+    snippet = _build_edit_region_snippet(previous, current, bundle=bundle)
     if snippet is None:
         return False
     lines.append(
@@ -429,26 +511,58 @@ def _append_region_snippet(lines: List[str], previous: str, current: str) -> boo
     return True
 
 
+def _first_spec_file(root: str) -> Optional[str]:
+    """First *.spec.js / *.test.js under *root*, in os.walk order, skipping ignored dirs."""
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return None
+    subdirs: List[str] = []
+    for entry in entries:
+        # DirEntry carries the type from the directory scan: only symlinks
+        # are stat'ed. As in os.walk, a link to a directory counts as a
+        # directory but is not descended into.
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if entry.name not in _IGNORE_DIR_SET and not entry.is_symlink():
+                subdirs.append(entry.path)
+        elif entry.name.endswith(('.spec.js', '.test.js')):
+            return entry.path
+    for subdir in subdirs:
+        found = _first_spec_file(subdir)
+        if found:
+            return found
+    return None
+
+
 def _find_and_read_spec() -> str:
     """Find and read spec/test file in sandbox if model hasn't read it yet."""
-    sandbox = _state_mod.SANDBOX_ROOT
-    if not sandbox:
-        return ""
     # Check if any spec file has already been read
     for tracked_path in FILE_VERSIONS:
         if tracked_path.endswith(('.spec.js', '.test.js')):
             return ""  # Spec already read, no injection needed
+    sandbox = _state_mod.SANDBOX_ROOT
+    if not sandbox:
+        return ""
 
-    # Find spec file in sandbox
-    spec_path = None
-    for root, _dirs, files in os.walk(sandbox):
-        for f in files:
-            if f.endswith('.spec.js') or f.endswith('.test.js'):
-                spec_path = os.path.join(root, f)
-                break
-        if spec_path:
-            break
-
+    # Find spec file in sandbox; the tree is only walked again once its
+    # root directory changes or a tool may have changed files below it
+    # (shell() and /clear drop the cache outright).
+    try:
+        root_mtime = os.stat(sandbox).st_mtime_ns
+    except OSError:
+        return ""
+    epoch = _state_mod.MUTATION_EPOCH
+    cached = _SPEC_SEARCH_RESULTS.get(sandbox)
+    if cached is not None and cached[:2] == (root_mtime, epoch):
+        spec_path = cached[2]
+    else:
+        spec_path = _first_spec_file(sandbox)
+        _SPEC_SEARCH_RESULTS[sandbox] = (root_mtime, epoch, spec_path)
     if not spec_path:
         return ""
 
@@ -456,19 +570,26 @@ def _find_and_read_spec() -> str:
         with open(spec_path, 'r', encoding='utf-8') as fh:
             content = fh.read()
     except Exception:
+        _SPEC_SEARCH_RESULTS.pop(sandbox, None)
         return ""
 
     # Track in FILE_VERSIONS so model can reference the path later
     _track_file_version(spec_path, content)
 
+    # Only whole lines up to the inline cap are numbered; the injection is a
+    # hint, and a huge spec would otherwise be formatted and sent in full.
+    display_spec = to_display_path(spec_path)
+    shown, more = content, ""
+    if len(content) > _INLINE_CONTENT_MAX_CHARS:
+        cut = content.rfind("\n", 0, _INLINE_CONTENT_MAX_CHARS) + 1 or _INLINE_CONTENT_MAX_CHARS
+        shown = content[:cut]
+        more = f"\n...[truncated {len(content) - cut} chars; read {display_spec} for the rest]..."
+
     # Format with line numbers
-    lines = content.splitlines(keepends=True)
-    out_parts = []
-    for i, line in enumerate(lines):
-        out_parts.append(f"{i + 1:4}| {line}")
+    numbered = "".join([f"{i:4}| {line}" for i, line in enumerate(shown.splitlines(keepends=True), 1)])
 
-    display_spec = to_display_path(spec_path)
-    return f"\n\nYou have not read the test file. Here are the tests:\n=== {display_spec} ===\n{''.join(out_parts)}"
+    # Returned stripped: write() appends it as its own output line.
+    return f"You have not read the test file. Here are the tests:\n=== {display_spec} ===\n{numbered.rstrip()}{more}"
 
 
 def _companion_spec_paths(path: str) -> List[str]:
@@ -482,8 +603,20 @@ def _companion_spec_paths(path: str) -> List[str]:
     return [candidate for candidate in candidates if os.path.exists(candidate)]
 
 
-def _spec_focus_payload(path: str) -> Optional[Dict[str, Any]]:
-    companion_specs = _companion_spec_paths(path)
+_SPEC_TITLE_RE = re.compile(
+    r"\b(?:x?test|x?it)\s*\(\s*([\"'])(?P<title>.+?)\1",
+    re.IGNORECASE | re.DOTALL,
+)
+_JS_NAMED_IMPORT_RE = re.compile(
+    r"import\s*\{\s*(?P<names>[^}]+)\s*\}\s*from\s*['\"](?P<module>[^'\"]+)['\"]",
+    re.IGNORECASE,
+)
+_NEW_SUFFIX_RE = re.compile(r"\bnew\s+$")
+
+
+def _spec_focus_payload(path: str, companion_specs: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    if companion_specs is None:
+        companion_specs = _companion_spec_paths(path)
     if not companion_specs:
         return None
 
@@ -494,14 +627,9 @@ def _spec_focus_payload(path: str) -> Optional[Dict[str, Any]]:
     except Exception:
         return None
 
-    title_re = re.compile(
-        r"\b(?:x?test|x?it)\s*\(\s*([\"'])(?P<title>.+?)\1",
-        re.IGNORECASE | re.DOTALL,
-    )
-
     titles: List[str] = []
     seen = set()
-    for match in title_re.finditer(content):
+    for match in _SPEC_TITLE_RE.finditer(content):
         title = " ".join(match.group("title").split())
         if not title or title in seen:
             continue
@@ -536,13 +664,9 @@ def _spec_focus_hint_from_payload(payload: Optional[Dict[str, Any]]) -> str:
 
 
 def _extract_js_imported_symbols(spec_content: str, source_basename: str) -> List[str]:
-    pattern = re.compile(
-        r"import\s*\{\s*(?P<names>[^}]+)\s*\}\s*from\s*['\"](?P<module>[^'\"]+)['\"]",
-        re.IGNORECASE,
-    )
     symbols: List[str] = []
     seen = set()
-    for match in pattern.finditer(spec_content):
+    for match in _JS_NAMED_IMPORT_RE.finditer(spec_content):
         module = match.group("module").strip()
         module_base = os.path.basename(module)
         if module_base != source_basename and module_base != f"{source_basename}.js":
@@ -568,64 +692,106 @@ def _extract_spec_called_api(spec_content: str, imported_symbols: List[str]) ->
     function_calls: List[str] = []
     seen_methods = set()
     seen_functions = set()
-    for symbol in imported_symbols:
-        escaped = re.escape(symbol)
-        method_patterns = [
-            rf"\bnew\s+{escaped}\s*\([^)]*\)\s*\.\s*([A-Za-z_]\w*)\s*\(",
-            rf"\b{escaped}\s*\.\s*([A-Za-z_]\w*)\s*\(",
-        ]
-        for pat in method_patterns:
-            for m in re.finditer(pat, spec_content):
-                name = m.group(1)
-                if name and name not in seen_methods:
-                    seen_methods.add(name)
-                    method_calls.append(name)
-        for m in re.finditer(rf"(?<!\.)\b{escaped}\s*\(", spec_content):
-            prefix = spec_content[max(0, m.start() - 8):m.start()]
-            if re.search(r"\bnew\s+$", prefix):
-                continue
-            full = m.group(0)
-            if full and symbol not in seen_functions:
-                seen_functions.add(symbol)
-                function_calls.append(symbol)
+    # One alternation over every imported symbol, matched as a lookahead at
+    # each position, so the spec is scanned once however many imports it
+    # has and a `new X(...)` match cannot swallow calls in its arguments.
+    names = "|".join(re.escape(symbol) for symbol in imported_symbols)
+    api_re = re.compile(
+        rf"(?=\bnew\s+(?:{names})\s*\([^)]*\)\s*\.\s*([A-Za-z_]\w*)\s*\("
+        rf"|\b({names})\s*(?:\.\s*([A-Za-z_]\w*)\s*)?\()"
+    )
+    for m in api_re.finditer(spec_content):
+        name = m.group(1) or m.group(3)
+        if name:
+            if name not in seen_methods:
+                seen_methods.add(name)
+                method_calls.append(name)
+            continue
+        start = m.start()
+        if start and spec_content[start - 1] == ".":
+            continue
+        if _NEW_SUFFIX_RE.search(spec_content[max(0, start - 8):start]):
+            continue
+        symbol = m.group(2)
+        if symbol not in seen_functions:
+            seen_functions.add(symbol)
+            function_calls.append(symbol)
     return method_calls, function_calls
 
 
-def _spec_contract_hint(path: str, source_content: str) -> str:
-    companion_specs = _companion_spec_paths(path)
+# Spec API calls per (spec path, source basename), valid while the spec's
+# stat signature is unchanged: {key: (signature, methods, functions)}.
+_SPEC_API_CACHE: Dict[Tuple[str, str], Tuple[Tuple[int, int, int, int], List[str], List[str]]] = {}
+
+
+@functools.lru_cache(maxsize=64)
+def _spec_api_patterns(
+    methods: Tuple[str, ...],
+    functions: Tuple[str, ...],
+) -> Tuple[Optional[re.Pattern], Optional[re.Pattern]]:
+    """One regex per API kind, so the source is scanned once per kind, not per name.
+
+    The method pattern captures call sites of any method; the function pattern
+    captures class, function and const/let/var declarations of any function.
+    """
+    method_re = None
+    if methods:
+        names = "|".join(map(re.escape, methods))
+        method_re = re.compile(rf"\b({names})\s*\(")
+    function_re = None
+    if functions:
+        names = "|".join(map(re.escape, functions))
+        function_re = re.compile(
+            rf"\b(?:export\s+)?(?:class\s+({names})\b"
+            rf"|(?:async\s+)?function\s+({names})\s*\("
+            rf"|(?:const|let|var)\s+({names})\s*=)"
+        )
+    return method_re, function_re
+
+
+def _spec_contract_hint(
+    path: str,
+    source_content: str,
+    companion_specs: Optional[List[str]] = None,
+) -> str:
+    if companion_specs is None:
+        companion_specs = _companion_spec_paths(path)
     if not companion_specs:
         return ""
     spec_path = companion_specs[0]
+    source_basename = os.path.splitext(os.path.basename(path))[0]
     try:
-        with open(spec_path, "r", encoding="utf-8") as fh:
-            spec_content = fh.read()
-    except Exception:
+        spec_sig = _stat_signature(os.stat(spec_path))
+    except OSError:
         return ""
-
-    source_basename = os.path.splitext(os.path.basename(path))[0]
-    imported_symbols = _extract_js_imported_symbols(spec_content, source_basename)
-    methods, functions = _extract_spec_called_api(spec_content, imported_symbols)
+    cache_key = (spec_path, source_basename)
+    cached = _SPEC_API_CACHE.get(cache_key)
+    if cached is not None and cached[0] == spec_sig:
+        methods, functions = cached[1], cached[2]
+    else:
+        try:
+            with open(spec_path, "r", encoding="utf-8") as fh:
+                spec_content = fh.read()
+        except Exception:
+            return ""
+        imported_symbols = _extract_js_imported_symbols(spec_content, source_basename)
+        methods, functions = _extract_spec_called_api(spec_content, imported_symbols)
+        _SPEC_API_CACHE[cache_key] = (spec_sig, methods, functions)
     if not methods and not functions:
         return ""
 
+    method_re, function_re = _spec_api_patterns(tuple(methods), tuple(functions))
     missing_methods: List[str] = []
-    for method in methods:
-        if not re.search(rf"\b{re.escape(method)}\s*\(", source_content):
-            missing_methods.append(method)
+    if method_re is not None:
+        called = {m.group(1) for m in method_re.finditer(source_content)}
+        missing_methods = [method for method in methods if method not in called]
 
     missing_functions: List[str] = []
-    for fn_name in functions:
-        if re.search(rf"\b(?:export\s+)?class\s+{re.escape(fn_name)}\b", source_content):
-            continue
-        if not re.search(
-            rf"\b(?:export\s+)?(?:async\s+)?function\s+{re.escape(fn_name)}\s*\(",
-            source_content,
-        ):
-            if not re.search(
-                rf"\b(?:export\s+)?(?:const|let|var)\s+{re.escape(fn_name)}\s*=\s*",
-                source_content,
-            ):
-                missing_functions.append(fn_name)
+    if function_re is not None:
+        declared = {
+            m.group(m.lastindex) for m in function_re.finditer(source_content)
+        }
+        missing_functions = [fn_name for fn_name in functions if fn_name not in declared]
 
     payload = {
         "spec": to_display_path(spec_path),
@@ -636,7 +802,7 @@ def _spec_contract_hint(path: str, source_content: str) -> str:
     return "spec_contract: " + json.dumps(payload, ensure_ascii=True, separators=(",", ":"))
 
 
-def _write_read_precondition_error(path: str) -> Optional[str]:
+def _write_read_precondition_error(path: str, companion_specs: Optional[List[str]] = None) -> Optional[str]:
     if not _enforce_read_before_write_enabled():
         return None
     if not os.path.exists(path):
@@ -648,7 +814,9 @@ def _write_read_precondition_error(path: str) -> Optional[str]:
             f"Action: read({{\"path\":\"{display_path}\"}}), then retry write."
         )
 
-    missing_specs = [spec for spec in _companion_spec_paths(path) if spec not in FILE_VERSIONS]
+    if companion_specs is None:
+        companion_specs = _companion_spec_paths(path)
+    missing_specs = [spec for spec in companion_specs if spec not in FILE_VERSIONS]
     if missing_specs:
         missing_display = ", ".join(to_display_path(spec) for spec in missing_specs)
         return (
@@ -659,74 +827,380 @@ def _write_read_precondition_error(path: str) -> Optional[str]:
     return None
 
 
-def _js_syntax_ok(code: str) -> bool:
-    """Check if code is valid JavaScript/ESM syntax using node -c."""
-    tmp_path = None
-    try:
-        fd, tmp_path = tempfile.mkstemp(suffix=".mjs")
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            f.write(code)
-        result = subprocess.run(
-            ["node", "-c", tmp_path],
-            capture_output=True, text=True, timeout=5,
+# Long-lived `node` that syntax-checks length-prefixed sources read from
+# stdin, answering "1\n" (valid) or "0\n" per source. SourceTextModule
+# parses with the same ESM grammar `node -c file.mjs` uses, without paying
+# Node start-up and a temp file on every check.
+_NODE_CHECK_SCRIPT = r"""
+const vm = require('vm');
+let buf = Buffer.alloc(0);
+process.stdin.on('data', (chunk) => {
+  buf = Buffer.concat([buf, chunk]);
+  while (buf.length >= 4) {
+    const n = buf.readUInt32BE(0);
+    if (buf.length < 4 + n) break;
+    const src = buf.subarray(4, 4 + n).toString('utf8');
+    buf = buf.subarray(4 + n);
+    let ok = '1';
+    try { new vm.SourceTextModule(src); } catch (e) { ok = '0'; }
+    process.stdout.write(ok + '\n');
+  }
+});
+"""
+_NODE_CHECK_TIMEOUT = 5.0
+_NODE_CHECKER: Optional[subprocess.Popen] = None
+_NODE_CHECKER_LOCK = threading.Lock()
+
+
+def _node_checker() -> subprocess.Popen:
+    global _NODE_CHECKER
+    proc = _NODE_CHECKER
+    if proc is None or proc.poll() is not None:
+        proc = subprocess.Popen(
+            ["node", "--experimental-vm-modules", "-e", _NODE_CHECK_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
         )
-        return result.returncode == 0
-    except Exception:
-        return True  # If check fails, assume valid (don't block)
+        _NODE_CHECKER = proc
+    return proc
+
+
+def _stop_node_checker() -> None:
+    global _NODE_CHECKER
+    proc, _NODE_CHECKER = _NODE_CHECKER, None
+    if proc is not None and proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+
+# The checker would exit on stdin EOF anyway; stopping it explicitly keeps
+# interpreter shutdown from racing a still-running child.
+atexit.register(_stop_node_checker)
+
+
+def _js_syntax_ok(code: Union[str, bytes]) -> bool:
+    """Check if code is valid JavaScript/ESM syntax using a persistent node checker.
+
+    Accepts the UTF-8 bytes directly when the caller has already encoded them.
+    """
+    return _js_syntax_check(code)[0]
+
+
+def _js_syntax_check(*sources: Union[str, bytes]) -> Tuple[bool, ...]:
+    """_js_syntax_ok for each source, sent to the checker in one round-trip."""
+    frames = []
+    for code in sources:
+        data = code if isinstance(code, bytes) else code.encode("utf-8")
+        frames.append(len(data).to_bytes(4, "big"))
+        frames.append(data)
+    # Each answer is exactly two bytes ("1\n" or "0\n").
+    expected = 2 * len(sources)
+    with _NODE_CHECKER_LOCK:
+        try:
+            proc = _node_checker()
+            proc.stdin.write(b"".join(frames))
+            proc.stdin.flush()
+            fd = proc.stdout.fileno()
+            reply = b""
+            while len(reply) < expected:
+                ready, _, _ = select.select([fd], [], [], _NODE_CHECK_TIMEOUT)
+                chunk = os.read(fd, expected - len(reply)) if ready else b""
+                if not chunk:
+                    raise OSError("node syntax checker did not answer")
+                reply += chunk
+        except Exception:
+            _stop_node_checker()
+            return (True,) * len(sources)  # If check fails, assume valid (don't block)
+    return tuple(reply[i:i + 2] != b"0\n" for i in range(0, expected, 2))
+
+
+# Files whose content passed the edit() syntax guard when we wrote them:
+# {path: stat signature of that write}.
+_JS_SYNTAX_OK: Dict[str, Tuple[int, int, int, int]] = {}
+
+
+def _js_text_known_ok(path: str, text: str) -> bool:
+    """True if *text* is what edit() last wrote to *path* after a passing syntax check."""
+    known = _WRITTEN_STATS.get(path)
+    return known is not None and known[1] is text and _JS_SYNTAX_OK.get(path) == known[0]
+
+
+_COMPARE_CHUNK = 128 * 1024
+
+# Per-thread read buffer reused across calls. Requests above the soft max
+# get a one-off buffer so a single large file does not stay resident.
+_SCRATCH = threading.local()
+_SCRATCH_SOFT_MAX = 128 * 1024
+
+
+def _scratch(size: int) -> bytearray:
+    buf = getattr(_SCRATCH, "buf", None)
+    if buf is not None and len(buf) >= size:
+        return buf
+    buf = bytearray(max(size, _SCRATCH_SOFT_MAX))
+    if len(buf) <= _SCRATCH_SOFT_MAX:
+        _SCRATCH.buf = buf
+    return buf
+
+
+def _read_unless_equal(path: str, data: bytes) -> Optional[bytes]:
+    """Return the bytes of *path*, or None when they equal *data*.
+
+    Files of the same size are compared chunk by chunk, so an unchanged file
+    is never held in memory whole and a mismatch stops the compare early.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size != len(data):
+            return f.read()
+        chunk = memoryview(_scratch(_COMPARE_CHUNK))[:_COMPARE_CHUNK]
+        expected = memoryview(data)
+        off = 0
+        while True:
+            n = f.readinto(chunk)
+            if not n:
+                return None if off == len(data) else data[:off]
+            if chunk[:n] != expected[off:off + n]:
+                return data[:off] + bytes(chunk[:n]) + f.read()
+            off += n
+
+
+def _read_text(path: str) -> str:
+    """Read *path* as UTF-8 text with one os.read sized from fstat.
+
+    Newlines are translated as in text-mode open(). Raises OSError or
+    UnicodeDecodeError like open().read() would.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        # One byte past the expected size tells a complete read from a file
+        # that grew (or reports st_size 0, like procfs) in the same call.
+        if size < _SCRATCH_SOFT_MAX and hasattr(os, "readv"):
+            view = memoryview(_scratch(size + 1))
+            n = os.readv(fd, [view[:size + 1]])
+            if n == size:
+                return _normalize_newlines(str(view[:n], "utf-8"))
+            data = bytes(view[:n])
+        else:
+            data = os.read(fd, size + 1)
+        if len(data) != size:
+            chunks = [data]
+            while True:
+                chunk = os.read(fd, max(size, _COMPARE_CHUNK))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            data = b"".join(chunks)
     finally:
-        if tmp_path:
+        os.close(fd)
+    return _normalize_newlines(data.decode("utf-8"))
+
+
+def _write_bytes(path: str, data: bytes) -> os.stat_result:
+    """Replace the contents of *path* with *data* using unbuffered os.write calls.
+
+    The whole buffer is handed to the kernel at once; the loop only covers
+    short writes. Mode 0o666 is filtered by the umask, as with open().
+    With LOCALCODE_WRITE_ATOMIC the data goes to a sibling temp file that is
+    renamed over *path* (over its target, for a symlink), so readers never
+    see a partial file; adding LOCALCODE_WRITE_DURABLE flushes that file to
+    disk before the rename. Files with several hard links are written in place.
+    Returns the file's stat after writing.
+    """
+    if _write_atomic_enabled():
+        return _write_bytes_atomic(path, data)
+    return _write_file_bytes(path, data)
+
+
+# fdatasync skips the metadata flush fsync does; macOS only has fsync.
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def _write_bytes_atomic(path: str, data: bytes) -> os.stat_result:
+    # Rename over the file a symlink points at, so the link itself survives.
+    target = os.path.realpath(path)
+    try:
+        st: Optional[os.stat_result] = os.stat(target)
+    except OSError:
+        st = None
+    if st is not None and st.st_nlink > 1:
+        # A rename would split this name off from the file's other hard links.
+        return _write_file_bytes(target, data)
+    tmp = f"{target}.tmp.{os.getpid()}"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        try:
+            _write_fd(fd, data)
+            if _write_durable_enabled():
+                _fdatasync(fd)
+        finally:
+            os.close(fd)
+        if st is not None:
+            os.chmod(tmp, st.st_mode & 0o7777)
             try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except OSError:
+                pass  # Only root (or the owner, for its groups) may chown.
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    # Stat after the rename: it may update ctime on the inode.
+    return os.stat(target)
 
 
-def _content_line_count(text: str) -> int:
-    if not text:
-        return 0
-    return text.count("\n") + (0 if text.endswith("\n") else 1)
+def _remember_written(path: str, st: os.stat_result, text: str, sha: str) -> None:
+    """Record that *path* now holds *text* (see _written_content)."""
+    if "\r" in text:
+        # Reads normalise line endings, so this is not the text a read returns.
+        _WRITTEN_STATS.pop(path, None)
+        return
+    _WRITTEN_STATS[path] = (_stat_signature(st), text, sha, time.time_ns())
+
+
+# File timestamps can be as coarse as 1 s (ext3, HFS+) or 2 s (FAT), so a
+# same-size rewrite in the same tick as ours leaves the stat signature as is.
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def _written_content(path: str) -> Optional[str]:
+    """Content write()/edit() last stored in *path*, if the file is unchanged since."""
+    known = _WRITTEN_STATS.get(path)
+    if known is None:
+        return None
+    try:
+        st = os.stat(path)
+        if _stat_signature(st) != known[0]:
+            return None
+        if known[3] - st.st_mtime_ns < _RACY_WINDOW_NS:
+            # Racily clean (as in git): recorded too close to the mtime for
+            # the stat to prove nothing changed since, so compare the bytes.
+            # The clock is read first; once the window has passed, any later
+            # write gets a newer mtime and the stat check alone is enough.
+            now = time.time_ns()
+            if _read_unless_equal(path, known[1].encode("utf-8")) is not None:
+                del _WRITTEN_STATS[path]
+                return None
+            if now - st.st_mtime_ns >= _RACY_WINDOW_NS:
+                _WRITTEN_STATS[path] = known[:3] + (now,)
+    except OSError:
+        return None
+    return known[1]
+
+
+def _content_digest_for(path: str, text: str) -> str:
+    """_content_digest(text), reusing the digest stored with our last write of *path*."""
+    known = _WRITTEN_STATS.get(path)
+    if known is not None and known[1] is text:
+        return known[2]
+    return _content_digest(text)
+
+
+def _content_line_count(data: bytes, newlines: Optional[int] = None) -> int:
+    # Counted on the encoded bytes: "\n" is never part of a multi-byte UTF-8
+    # sequence, and bytes.count is the faster scan. An unterminated last
+    # line counts; empty content has no lines.
+    if newlines is None:
+        newlines = data.count(b"\n")
+    return newlines + (0 if data[-1:] in (b"\n", b"") else 1)
 
 
 def _content_digest(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+    return _bytes_digest(text.encode("utf-8"))
 
 
-def _changed_lines_est(previous: str, current: str) -> int:
+def _bytes_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+# Declarations recognised on changed lines by _changed_symbols().
+_JS_KEYWORDS = frozenset({
+    "if", "for", "while", "switch", "catch", "return", "throw", "new",
+    "typeof", "instanceof", "void", "delete", "in", "of", "do", "else",
+    "case", "default", "break", "continue", "try", "finally", "await",
+    "yield", "class", "function", "const", "let", "var", "import", "export",
+    "extends", "super",
+})
+_SYMBOL_CLASS_RE = re.compile(r"^(?:export\s+)?class\s+([A-Za-z_]\w*)\b")
+_SYMBOL_FUNCTION_RE = re.compile(r"^(?:export\s+)?(?:async\s+)?function\s+([A-Za-z_]\w*)\s*\(")
+_SYMBOL_METHOD_RE = re.compile(r"^(?:async\s+)?([A-Za-z_]\w*)\s*\([^=]*\)\s*\{?$")
+_SYMBOL_CONST_FN_RE = re.compile(
+    r"^(?:export\s+)?(?:const|let|var)\s+([A-Za-z_]\w*)\s*=\s*(?:async\s*)?(?:\([^)]*\)|[A-Za-z_]\w*)\s*=>"
+)
+
+
+def _diff_bundle(previous: str, current: str) -> Dict[str, Any]:
+    """Split, trim and match *previous* against *current* once.
+
+    The change summary, changed-line estimate, symbol scan and preview all
+    read from this one result instead of each re-diffing the two texts.
+    """
     prev_lines = previous.splitlines()
     curr_lines = current.splitlines()
-    matcher = difflib.SequenceMatcher(a=prev_lines, b=curr_lines, autojunk=False)
+    prefix, prev_mid, curr_mid = _trim_common(prev_lines, curr_lines)
+    if prev_mid and curr_mid:
+        matcher = difflib.SequenceMatcher(a=prev_mid, b=curr_mid, autojunk=False)
+        opcodes = [op for op in matcher.get_opcodes() if op[0] != "equal"]
+    elif curr_mid:
+        # Pure insertion (e.g. a new file): the matcher would index every
+        # line only to report the one opcode known here.
+        opcodes = [("insert", 0, 0, 0, len(curr_mid))]
+    elif prev_mid:
+        opcodes = [("delete", 0, len(prev_mid), 0, 0)]
+    else:
+        opcodes = []
     changed = 0
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    for tag, i1, i2, j1, j2 in opcodes:
         if tag == "replace":
             changed += max(i2 - i1, j2 - j1)
         elif tag == "delete":
             changed += i2 - i1
-        elif tag == "insert":
+        else:
             changed += j2 - j1
-    return changed
+    return {
+        "curr_lines": curr_lines,
+        "line_delta": len(curr_lines) - len(prev_lines),
+        "prefix": prefix,
+        "prev_mid": prev_mid,
+        "curr_mid": curr_mid,
+        "opcodes": opcodes,
+        "changed_lines": changed,
+    }
 
 
-def _change_summary(previous: str, current: str) -> str:
-    prev_lines = previous.splitlines()
-    curr_lines = current.splitlines()
-    changed_lines_est = _changed_lines_est(previous, current)
+def _changed_lines_est(previous: str, current: str) -> int:
+    return _diff_bundle(previous, current)["changed_lines"]
+
+
+def _change_summary(
+    previous: str,
+    current: str,
+    prev_sha: Optional[str] = None,
+    new_sha: Optional[str] = None,
+    bundle: Optional[Dict[str, Any]] = None,
+) -> str:
+    if bundle is None:
+        bundle = _diff_bundle(previous, current)
     return (
-        f"change_summary: prev_sha256={_content_digest(previous)} "
-        f"new_sha256={_content_digest(current)} "
-        f"changed_lines~={changed_lines_est} "
-        f"line_delta={len(curr_lines) - len(prev_lines)} "
+        f"change_summary: prev_sha256={prev_sha or _content_digest(previous)} "
+        f"new_sha256={new_sha or _content_digest(current)} "
+        f"changed_lines~={bundle['changed_lines']} "
+        f"line_delta={bundle['line_delta']} "
         f"char_delta={len(current) - len(previous)}"
     )
 
 
-def _changed_symbols(previous: str, current: str, max_symbols: int = 10) -> List[str]:
-    js_keywords = {
-        "if", "for", "while", "switch", "catch", "return", "throw", "new",
-        "typeof", "instanceof", "void", "delete", "in", "of", "do", "else",
-        "case", "default", "break", "continue", "try", "finally", "await",
-        "yield", "class", "function", "const", "let", "var", "import", "export",
-        "extends", "super",
-    }
+def _changed_symbols(
+    previous: str,
+    current: str,
+    max_symbols: int = 10,
+    bundle: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    js_keywords = _JS_KEYWORDS
 
     def _add_symbol(raw: str, out: List[str], seen: set) -> None:
         name = raw.strip()
@@ -737,59 +1211,63 @@ def _changed_symbols(previous: str, current: str, max_symbols: int = 10) -> List
         seen.add(name)
         out.append(name)
 
-    diff_lines = list(
-        difflib.unified_diff(
-            previous.splitlines(),
-            current.splitlines(),
-            fromfile="before",
-            tofile="after",
-            lineterm="",
-            n=1,
-        )
-    )
+    if bundle is None:
+        bundle = _diff_bundle(previous, current)
+    prev_mid = bundle["prev_mid"]
+    curr_mid = bundle["curr_mid"]
+    # Removed lines, then added lines, per change block (unified diff order).
+    diff_lines: List[str] = []
+    for _tag, i1, i2, j1, j2 in bundle["opcodes"]:
+        diff_lines.extend(prev_mid[i1:i2])
+        diff_lines.extend(curr_mid[j1:j2])
     symbols: List[str] = []
     seen = set()
     for line in diff_lines:
-        if not (line.startswith("+") or line.startswith("-")):
-            continue
-        if line.startswith("+++") or line.startswith("---"):
-            continue
-        text = line[1:].strip()
-        m_class = re.match(r"^(?:export\s+)?class\s+([A-Za-z_]\w*)\b", text)
-        if m_class:
-            _add_symbol(f"class:{m_class.group(1)}", symbols, seen)
-
-        m_function = re.match(r"^(?:export\s+)?(?:async\s+)?function\s+([A-Za-z_]\w*)\s*\(", text)
-        if m_function:
-            _add_symbol(f"fn:{m_function.group(1)}", symbols, seen)
-
-        m_method = re.match(r"^(?:async\s+)?([A-Za-z_]\w*)\s*\([^=]*\)\s*\{?$", text)
-        if m_method:
-            name = m_method.group(1)
-            if name not in js_keywords:
-                _add_symbol(f"fn:{name}", symbols, seen)
-
-        m_const_fn = re.match(
-            r"^(?:export\s+)?(?:const|let|var)\s+([A-Za-z_]\w*)\s*=\s*(?:async\s*)?(?:\([^)]*\)|[A-Za-z_]\w*)\s*=>",
-            text,
-        )
-        if m_const_fn:
-            _add_symbol(f"fn:{m_const_fn.group(1)}", symbols, seen)
+        text = line.strip()
+        # Each pattern needs a literal its regex cannot match without, so a
+        # substring test gates it: most changed lines skip every regex.
+        if "class" in text:
+            m_class = _SYMBOL_CLASS_RE.match(text)
+            if m_class:
+                _add_symbol(f"class:{m_class.group(1)}", symbols, seen)
+
+        if "function" in text:
+            m_function = _SYMBOL_FUNCTION_RE.match(text)
+            if m_function:
+                _add_symbol(f"fn:{m_function.group(1)}", symbols, seen)
+
+        if text.endswith((")", "{")):
+            m_method = _SYMBOL_METHOD_RE.match(text)
+            if m_method:
+                name = m_method.group(1)
+                if name not in js_keywords:
+                    _add_symbol(f"fn:{name}", symbols, seen)
+
+        if "=>" in text:
+            m_const_fn = _SYMBOL_CONST_FN_RE.match(text)
+            if m_const_fn:
+                _add_symbol(f"fn:{m_const_fn.group(1)}", symbols, seen)
         if len(symbols) >= max_symbols:
             break
     return symbols
 
 
-def _changed_line_preview(previous: str, current: str, max_lines: int = 6) -> str:
-    prev_lines = previous.splitlines()
-    curr_lines = current.splitlines()
-    matcher = difflib.SequenceMatcher(a=prev_lines, b=curr_lines, autojunk=False)
+def _changed_line_preview(
+    previous: str,
+    current: str,
+    max_lines: int = 6,
+    bundle: Optional[Dict[str, Any]] = None,
+) -> str:
+    if bundle is None:
+        bundle = _diff_bundle(previous, current)
+    curr_lines = bundle["curr_lines"]
+    prefix = bundle["prefix"]
 
     changed_indexes: List[int] = []
     seen = set()
-    for tag, _i1, _i2, j1, j2 in matcher.get_opcodes():
-        if tag == "equal":
-            continue
+    for _tag, _i1, _i2, j1, j2 in bundle["opcodes"]:
+        j1 += prefix
+        j2 += prefix
         if j1 < j2:
             for idx in range(j1, min(j2, j1 + max_lines)):
                 if idx not in seen:
@@ -828,6 +1306,38 @@ def _changed_line_preview(previous: str, current: str, max_lines: int = 6) -> st
     return "\n".join(out)
 
 
+# Cap on file content echoed back in edit() error messages.
+_INLINE_CONTENT_MAX_CHARS = 200 * 1024
+
+
+def _inline_content(text: str, near: Optional[str] = None) -> str:
+    """*text* capped at _INLINE_CONTENT_MAX_CHARS.
+
+    When capped and the first non-blank line of *near* occurs in *text*, the
+    window starts shortly before it, so the region the model was aiming
+    at stays visible; otherwise the head of the file is kept.
+    """
+    limit = _INLINE_CONTENT_MAX_CHARS
+    if len(text) <= limit:
+        return text
+    start = 0
+    anchor = next((line.strip() for line in (near or "").splitlines() if line.strip()), "")
+    hit = text.find(anchor[:80]) if anchor else -1
+    if hit > 0:
+        # Begin a quarter of the window before the hit, on the start of that
+        # line unless the line is too long to keep the hit in view.
+        start = max(0, hit - limit // 4)
+        line_start = text.rfind("\n", 0, start) + 1
+        if hit - line_start < limit:
+            start = line_start
+        start = min(start, len(text) - limit)
+    end = start + limit
+    head = f"...[truncated {start} chars]...\n" if start else ""
+    removed = len(text) - end
+    tail = f"\n...[truncated {removed} chars; read the file for the rest]..." if removed > 0 else ""
+    return f"{head}{text[start:end]}{tail}"
+
+
 def _changed_symbols_line(symbols: List[str]) -> str:
     if not symbols:
         return "changed_symbols: -"
@@ -835,11 +1345,29 @@ def _changed_symbols_line(symbols: List[str]) -> str:
 
 
 def _current_file_sha(path: str) -> str:
+    known = _written_content(path)
+    if known is not None:
+        return _content_digest_for(path, known)
+    # Stat taken before the read: a change in between only causes a miss later.
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return _short_sha_text(f.read())
+        sig = _stat_signature(os.stat(path))
+        cached = _DIGEST_CACHE.get(path)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        with open(path, "rb") as f:
+            data = f.read()
+        # Digest of the text as _read_text returns it. Without "\r" there is
+        # nothing to translate, so the raw bytes are hashed once the decode
+        # has shown they are UTF-8 (undecodable files stay "unknown").
+        text = data.decode("utf-8")
+        if b"\r" in data:
+            sha = _short_sha_text(_normalize_newlines(text))
+        else:
+            sha = _bytes_digest(data)
     except Exception:
         return "unknown"
+    _DIGEST_CACHE[path] = (sig, sha)
+    return sha
 
 
 _HASHLINE_REF_RE = re.compile(r"^\s*(\d+)\s*:\s*([0-9a-fA-F]{2,16})(?:\|.*)?\s*$")
@@ -952,12 +1480,17 @@ def write(args: Any) -> str:
                 return f"error: {e}"
         else:
             return f"error: {e}"
+    basename = os.path.basename(path)
     if _should_block_test_edit(path):
-        basename = os.path.basename(path)
         return f"error: cannot write to {basename}; test files are read-only. Use write_file on your source code file only."
     display_path = to_display_path(path)
 
-    precondition_error = _write_read_precondition_error(path)
+    # Looked up once for the read precondition and the spec hints below.
+    companion_specs: Optional[List[str]] = None
+    if _enforce_read_before_write_enabled() or _write_spec_focus_enabled() or _write_spec_contract_enabled():
+        companion_specs = _companion_spec_paths(path)
+
+    precondition_error = _write_read_precondition_error(path, companion_specs)
     if precondition_error:
         return precondition_error
 
@@ -969,29 +1502,62 @@ def write(args: Any) -> str:
 
     full_drop_fields = _write_full_drop_fields()
 
+    # Encode once: the same bytes serve the no-op compare and the write below.
+    content_bytes = content.encode("utf-8")
+    new_lines = content_bytes.count(b"\n")
+    line_total = _content_line_count(content_bytes, new_lines)
+    new_sha = _bytes_digest(content_bytes)
+
     old_content = ""
-    is_new_file = True
-    if os.path.exists(path):
-        is_new_file = False
+    disk_sha: Optional[str] = None
+    disk_newlines: Optional[int] = None
+    # The file still holds what we last wrote: its content is already in
+    # memory, so neither the no-op check nor the diff needs to read it.
+    known = _written_content(path)
+    is_new_file = False
+    if known is None:
+        # No exists() probe: the read itself tells a new file apart.
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                old_content = f.read()
+            old_bytes = _read_unless_equal(path, content_bytes)
+        except FileNotFoundError:
+            is_new_file = True
         except Exception:
-            old_content = ""
-        if old_content == content:
-            _NOOP_COUNTS.setdefault(path, {})
-            _NOOP_COUNTS[path]["write"] = _NOOP_COUNTS[path].get("write", 0) + 1
-            noop_n = _NOOP_COUNTS[path]["write"]
+            old_bytes = b""
+    if not is_new_file:
+        if known is not None:
+            old_content = known
+            is_noop = old_content == content
+        else:
+            # Byte-identical content is a no-op without decoding; otherwise
+            # decode with the newline translation text-mode reads applied.
+            is_noop = old_bytes is None
+            if not is_noop:
+                try:
+                    old_content = _normalize_newlines(old_bytes.decode("utf-8"))
+                except UnicodeDecodeError:
+                    old_content = ""
+                is_noop = old_content == content
+                # With no "\r" to translate, the bytes on disk are exactly the
+                # encoded text: hash and count them now rather than re-encoding
+                # (or scanning the possibly wider str) later.
+                if not is_noop and old_content and b"\r" not in old_bytes:
+                    disk_sha = _bytes_digest(old_bytes)
+                    disk_newlines = old_bytes.count(b"\n")
+                # Only the decoded text is needed from here on.
+                del old_bytes
+        if is_noop:
+            noop_n = _NOOP_WRITE_COUNTS.get(path, 0) + 1
+            _NOOP_WRITE_COUNTS[path] = noop_n
             file_state = (
-                f"file_state: lines={_content_line_count(content)} "
-                f"chars={len(content)} sha256={_content_digest(content)}"
+                f"file_state: lines={line_total} "
+                f"chars={len(content)} sha256={new_sha}"
             )
             mutation = _record_mutation(
                 op="write",
                 path=path,
                 changed=False,
-                before_sha=_content_digest(content),
-                after_sha=_content_digest(content),
+                before_sha=new_sha,
+                after_sha=new_sha,
                 changed_lines_est=0,
                 noop_streak_for_file=noop_n,
             )
@@ -1012,7 +1578,7 @@ def write(args: Any) -> str:
                     return "\n".join(lines)
                 lines = [
                     (
-                        f"error: repeated no-op write for {os.path.basename(path)}. "
+                        f"error: repeated no-op write for {basename}. "
                         "Write different content, or call finish if implementation is already correct."
                     )
                 ]
@@ -1032,201 +1598,140 @@ def write(args: Any) -> str:
                     f"{decision_hint}"
                 )
             return (
-                f"error: repeated no-op write for {os.path.basename(path)}. "
+                f"error: repeated no-op write for {basename}. "
                 "Write different content, or call finish if implementation is already correct.\n"
                 f"{file_state}\n"
                 f"{decision_hint}"
             )
 
-    parent_dir = os.path.dirname(path)
-    if parent_dir and not os.path.exists(parent_dir):
-        os.makedirs(parent_dir, exist_ok=True)
+    # Taken before tracking the new content replaces the cached count.
+    if is_new_file:
+        old_lines = 0
+    elif disk_newlines is not None:
+        old_lines = disk_newlines
+    else:
+        old_lines = _cached_newline_count(path, old_content)
 
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    try:
+        written_st = _write_bytes(path, content_bytes)
+    except FileNotFoundError:
+        # Only a new file can lack its parent directory: it is created on
+        # demand instead of being stat'ed before every write.
+        parent_dir = os.path.dirname(path)
+        if not is_new_file or not parent_dir:
+            raise
+        os.makedirs(parent_dir, exist_ok=True)
+        written_st = _write_bytes(path, content_bytes)
+    _remember_written(path, written_st, content, new_sha)
 
-    _track_file_version(path, content)
+    _track_file_version(path, content, new_lines)
     WRITTEN_PATHS.add(path)
 
     # Clear noop count on real change
-    if path in _NOOP_COUNTS:
-        _NOOP_COUNTS[path].pop("write", None)
+    _NOOP_WRITE_COUNTS.pop(path, None)
 
     # Optional test injection for weak models (off by default).
     spec_inject = _find_and_read_spec() if _inject_tests_on_write_enabled() else ""
-    spec_focus_payload = _spec_focus_payload(path) if _write_spec_focus_enabled() else None
+    spec_focus_payload = _spec_focus_payload(path, companion_specs) if _write_spec_focus_enabled() else None
     spec_focus = _spec_focus_hint_from_payload(spec_focus_payload)
-    spec_contract = _spec_contract_hint(path, content) if _write_spec_contract_enabled() else ""
+    spec_contract = _spec_contract_hint(path, content, companion_specs) if _write_spec_contract_enabled() else ""
     write_hint = ""
     if _tool_hints_enabled():
-        write_hint = "\nHint: optionally read the file to verify, then continue or finish."
+        write_hint = "Hint: optionally read the file to verify, then continue or finish."
 
     if is_new_file:
-        additions = content.count("\n") + (1 if content and not content.endswith("\n") else 0)
-        file_state = (
-            f"file_state: lines={_content_line_count(content)} "
-            f"chars={len(content)} sha256={_content_digest(content)}"
-        )
-        mutation = _record_mutation(
-            op="write",
-            path=path,
-            changed=True,
-            before_sha=_short_sha_text(""),
-            after_sha=_content_digest(content),
-            changed_lines_est=_changed_lines_est("", content),
-            changed_symbols=_changed_symbols("", content),
-            noop_streak_for_file=0,
-        )
-        decision_hint = _mutation_decision_hint(mutation)
-        state_brief = _mutation_brief_line(mutation)
-        state_line = _mutation_state_line(mutation)
-        loop_hint = ""
-        if int(mutation.get("write_streak_for_file", 0) or 0) >= 2:
-            loop_hint = (
-                f"\nloop_guard: repeated full-file write streak={mutation.get('write_streak_for_file')} "
-                "on this file; prefer edit/apply_patch or finish."
-            )
-        symbols_line = _changed_symbols_line(list(mutation.get("changed_symbols") or []))
-        if _write_verbose_state_enabled():
-            lines: List[str] = [f"ok: created {display_path}, +{additions} lines"]
-            if _write_full_field_enabled(full_drop_fields, "file_state"):
-                lines.append(file_state)
-            if _write_full_field_enabled(full_drop_fields, "decision_hint"):
-                lines.append(decision_hint)
-            if _write_full_field_enabled(full_drop_fields, "state_brief"):
-                lines.append(state_brief)
-            if _write_full_field_enabled(full_drop_fields, "state_json"):
-                lines.append(state_line)
-            if _write_full_field_enabled(full_drop_fields, "changed_symbols"):
-                lines.append(symbols_line)
-            if _write_full_field_enabled(full_drop_fields, "changed_lines_preview"):
-                if _write_success_snippet_enabled():
-                    _append_region_snippet(lines, "", content)
-                else:
-                    lines.append(_changed_line_preview("", content))
-            if loop_hint.strip():
-                lines.append(loop_hint.strip())
-            if spec_inject.strip():
-                lines.append(spec_inject.strip())
-            if spec_focus.strip():
-                lines.append(spec_focus.strip())
-            if spec_contract.strip():
-                lines.append(spec_contract.strip())
-            if write_hint.strip():
-                lines.append(write_hint.strip())
-            return "\n".join(lines)
-
-        out: List[str] = [
-            f"ok: created {display_path}, +{additions} lines",
-            file_state,
-            _change_summary("", content),
-        ]
-        if _write_success_snippet_enabled():
-            _append_region_snippet(out, "", content)
-        else:
-            out.append(_changed_line_preview("", content))
-        if not _is_default_write_decision_hint(decision_hint):
-            out.append(decision_hint)
-        if loop_hint.strip():
-            out.append(loop_hint.strip())
-        if spec_inject.strip():
-            out.append(spec_inject.strip())
-        if spec_focus.strip():
-            out.append(spec_focus.strip())
-        if spec_contract.strip():
-            out.append(spec_contract.strip())
-        if write_hint.strip():
-            out.append(write_hint.strip())
-        return "\n".join(out)
-
-    old_lines = old_content.count("\n")
-    new_lines = content.count("\n")
-    additions = max(0, new_lines - old_lines)
-    removals = max(0, old_lines - new_lines)
-    file_state = (
-        f"file_state: lines={_content_line_count(content)} "
-        f"chars={len(content)} sha256={_content_digest(content)}"
-    )
-    changed_lines = _changed_lines_est(old_content, content)
-    symbols = _changed_symbols(old_content, content)
+        header = f"ok: created {display_path}, +{line_total} lines"
+        old_sha = _short_sha_text("")
+    else:
+        additions = max(0, new_lines - old_lines)
+        removals = max(0, old_lines - new_lines)
+        header = f"ok: updated {display_path}, +{additions} -{removals} lines"
+        old_sha = disk_sha or _content_digest_for(path, old_content)
+    diff = _diff_bundle(old_content, content)
     mutation = _record_mutation(
         op="write",
         path=path,
         changed=True,
-        before_sha=_content_digest(old_content),
-        after_sha=_content_digest(content),
-        changed_lines_est=changed_lines,
-        changed_symbols=symbols,
+        before_sha=old_sha,
+        after_sha=new_sha,
+        changed_lines_est=diff["changed_lines"],
+        changed_symbols=_changed_symbols(old_content, content, bundle=diff),
         noop_streak_for_file=0,
     )
+    lines = _build_write_success_lines(
+        header=header,
+        file_state=f"file_state: lines={line_total} chars={len(content)} sha256={new_sha}",
+        mutation=mutation,
+        previous=old_content,
+        current=content,
+        bundle=diff,
+        prev_sha=old_sha,
+        new_sha=new_sha,
+        is_new_file=is_new_file,
+        drop_fields=full_drop_fields,
+    )
+    # Each trailer is either "" or an already-stripped line.
+    lines.extend(extra for extra in (spec_inject, spec_focus, spec_contract, write_hint) if extra)
+    return "\n".join(lines)
+
+
+def _build_write_success_lines(
+    *,
+    header: str,
+    file_state: str,
+    mutation: Dict[str, Any],
+    previous: str,
+    current: str,
+    bundle: Dict[str, Any],
+    prev_sha: str,
+    new_sha: str,
+    is_new_file: bool,
+    drop_fields: set[str],
+) -> List[str]:
+    """Build write()'s success lines from one diff bundle.
+
+    Verbose mode emits every field not in *drop_fields*; otherwise the compact
+    form is used. Diff-derived lines are only built when they are emitted.
+    """
     decision_hint = _mutation_decision_hint(mutation)
-    state_brief = _mutation_brief_line(mutation)
-    state_line = _mutation_state_line(mutation)
-    loop_hint = ""
-    if int(mutation.get("write_streak_for_file", 0) or 0) >= 2:
-        loop_hint = (
-            f"\nloop_guard: repeated full-file write streak={mutation.get('write_streak_for_file')} "
-            "on this file; prefer edit/apply_patch or finish."
-        )
-    summary = _change_summary(old_content, content)
-    symbols_line = _changed_symbols_line(symbols)
-    snippet_lines: List[str] = []
-    if _write_success_snippet_enabled():
-        _append_region_snippet(snippet_lines, old_content, content)
-    changed_preview = _changed_line_preview(old_content, content)
+
+    def _summary() -> str:
+        return _change_summary(previous, current, prev_sha=prev_sha, new_sha=new_sha, bundle=bundle)
+
+    def _preview(out: List[str]) -> None:
+        if _write_success_snippet_enabled() and _append_region_snippet(out, previous, current, bundle=bundle):
+            return
+        out.append(_changed_line_preview(previous, current, bundle=bundle))
+
+    lines: List[str] = [header]
     if _write_verbose_state_enabled():
-        lines: List[str] = [f"ok: updated {display_path}, +{additions} -{removals} lines"]
-        if _write_full_field_enabled(full_drop_fields, "file_state"):
+        if _write_full_field_enabled(drop_fields, "file_state"):
             lines.append(file_state)
-        if _write_full_field_enabled(full_drop_fields, "decision_hint"):
+        if _write_full_field_enabled(drop_fields, "decision_hint"):
             lines.append(decision_hint)
-        if _write_full_field_enabled(full_drop_fields, "state_brief"):
-            lines.append(state_brief)
-        if _write_full_field_enabled(full_drop_fields, "state_json"):
-            lines.append(state_line)
-        if _write_full_field_enabled(full_drop_fields, "change_summary"):
-            lines.append(summary)
-        if _write_full_field_enabled(full_drop_fields, "changed_symbols"):
-            lines.append(symbols_line)
-        if _write_full_field_enabled(full_drop_fields, "changed_lines_preview"):
-            if snippet_lines:
-                lines.extend(snippet_lines)
-            else:
-                lines.append(changed_preview)
-        if loop_hint.strip():
-            lines.append(loop_hint.strip())
-        if spec_inject.strip():
-            lines.append(spec_inject.strip())
-        if spec_focus.strip():
-            lines.append(spec_focus.strip())
-        if spec_contract.strip():
-            lines.append(spec_contract.strip())
-        if write_hint.strip():
-            lines.append(write_hint.strip())
-        return "\n".join(lines)
-
-    out: List[str] = [
-        f"ok: updated {display_path}, +{additions} -{removals} lines",
-        file_state,
-        summary,
-    ]
-    if snippet_lines:
-        out.extend(snippet_lines)
+        if _write_full_field_enabled(drop_fields, "state_brief"):
+            lines.append(_mutation_brief_line(mutation))
+        if _write_full_field_enabled(drop_fields, "state_json"):
+            lines.append(_mutation_state_line(mutation))
+        if not is_new_file and _write_full_field_enabled(drop_fields, "change_summary"):
+            lines.append(_summary())
+        if _write_full_field_enabled(drop_fields, "changed_symbols"):
+            lines.append(_changed_symbols_line(list(mutation.get("changed_symbols") or [])))
+        if _write_full_field_enabled(drop_fields, "changed_lines_preview"):
+            _preview(lines)
     else:
-        out.append(changed_preview)
-    if not _is_default_write_decision_hint(decision_hint):
-        out.append(decision_hint)
-    if loop_hint.strip():
-        out.append(loop_hint.strip())
-    if spec_inject.strip():
-        out.append(spec_inject.strip())
-    if spec_focus.strip():
-        out.append(spec_focus.strip())
-    if spec_contract.strip():
-        out.append(spec_contract.strip())
-    if write_hint.strip():
-        out.append(write_hint.strip())
-    return "\n".join(out)
+        lines.append(file_state)
+        lines.append(_summary())
+        _preview(lines)
+        if not _is_default_write_decision_hint(decision_hint):
+            lines.append(decision_hint)
+    streak = int(mutation.get("write_streak_for_file", 0) or 0)
+    if streak >= 2:
+        lines.append(
+            f"loop_guard: repeated full-file write streak={streak} "
+            "on this file; prefer edit/apply_patch or finish."
+        )
+    return lines
 
 
 def edit(args: Any) -> str:
@@ -1247,8 +1752,8 @@ def edit(args: Any) -> str:
                 return f"error: {e}"
         else:
             return f"error: {e}"
+    basename = os.path.basename(path)
     if _should_block_test_edit(path):
-        basename = os.path.basename(path)
         return f"error: cannot edit {basename}; test files are read-only. Use replace_in_file on your source code file only."
     display_path = to_display_path(path)
 
@@ -1269,12 +1774,11 @@ def edit(args: Any) -> str:
     # 2) hashline anchors: old_start[/old_end] + new (old optional)
     if new is None or (old is None and not use_anchors):
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
+            text = _read_text(path)
             _track_file_version(path, text)
             return (
                 "error: missing required parameters for edit; provide old+new or old_start+new.\n"
-                f"Current file content:\n{text}"
+                f"Current file content:\n{_inline_content(text, old)}"
             )
         except Exception:
             return f"error: file not found: {display_path}"
@@ -1284,14 +1788,14 @@ def edit(args: Any) -> str:
     if not isinstance(new, str):
         return "error: new must be a string"
 
-    _NOOP_COUNTS.setdefault(path, {})
-
-    basename = os.path.basename(path)
+    counts = _NOOP_COUNTS.get(path)
+    if counts is None:
+        counts = _NOOP_COUNTS[path] = _NoopCounts()
 
     # Noop: old == new — progressive handling to break loops
     if old is not None and old == new and not use_anchors:
-        _NOOP_COUNTS[path]["edit_noop"] = _NOOP_COUNTS[path].get("edit_noop", 0) + 1
-        noop_n = _NOOP_COUNTS[path]["edit_noop"]
+        counts.edit_noop += 1
+        noop_n = counts.edit_noop
         current_sha = _current_file_sha(path)
         mutation = _record_mutation(
             op="edit",
@@ -1323,11 +1827,12 @@ def edit(args: Any) -> str:
             )
         return f"error: repeated no-op edit in {basename}\n{decision_hint}\n{state_brief}\n{state_line}"
 
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            text = f.read()
-    except Exception:
-        return f"error: file not found: {display_path}"
+    text = _written_content(path)
+    if text is None:
+        try:
+            text = _read_text(path)
+        except Exception:
+            return f"error: file not found: {display_path}"
 
     replacement_count = 1
     if use_anchors:
@@ -1337,9 +1842,12 @@ def edit(args: Any) -> str:
         replacement = f"{anchor_ctx['prefix']}{new}{anchor_ctx['suffix']}"
         resolved_old = anchor_ctx["selected"]
     else:
-        resolved_old = old
-        if old not in text:
-            resolved_old = _resolve_old_text(text, old)
+        replace_all = bool(args.get("all"))
+        # An exact unique hit is located here rather than by
+        # _resolve_old_text's `in` test, so the uniqueness check below
+        # resumes after the match instead of rescanning the text.
+        first = text.find(old) if old and not replace_all else -1
+        resolved_old = old if first != -1 else _resolve_old_text(text, old)
         if resolved_old is None:
             read_hint = ""
             if path not in FILE_VERSIONS:
@@ -1347,68 +1855,98 @@ def edit(args: Any) -> str:
             return (
                 f"error: old text was not found in {basename}.\n"
                 "This usually means whitespace, line-break, or Unicode punctuation mismatch.\n"
-                f"Here is the current content of {basename}:\n{text}\n"
+                f"Here is the current content of {basename}:\n{_inline_content(text, old)}\n"
                 f"Action: copy the exact text (including whitespace) from above, then retry edit with a larger exact old/new block if needed.{read_hint}"
             )
 
-        count = text.count(resolved_old)
-        if not args.get("all") and count > 1:
+        if not resolved_old:
+            # An empty 'old' matches at every position, len(text) + 1 times;
+            # only build the result when that is not the ambiguity error.
+            count = len(text) + 1
+            replacement = text.replace("", new) if replace_all or count == 1 else text
+        elif replace_all:
+            # str.replace has dedicated single-character and equal-length
+            # paths, so for replace-all it beats count-and-splice. Each
+            # replacement shifts the length by the same amount, so the count
+            # falls out of the result unless old and new are the same length.
+            replacement = text.replace(resolved_old, new)
+            delta = len(new) - len(resolved_old)
+            count = (len(replacement) - len(text)) // delta if delta else text.count(resolved_old)
+        else:
+            if first == -1:
+                first = text.find(resolved_old)
+            end = first + len(resolved_old)
+            # A second match anywhere after the first makes the edit
+            # ambiguous; the search stops there rather than counting all.
+            count = 0 if first == -1 else 1 if text.find(resolved_old, end) == -1 else 2
+            replacement = text if first == -1 else f"{text[:first]}{new}{text[end:]}"
+        if not replace_all and count > 1:
+            count = text.count(resolved_old)
             return (
                 f"error: 'old' text appears {count} times in {basename}; it must be unique. "
                 f"Include more surrounding lines in 'old' to make it unique, or set all=true to replace all occurrences."
             )
+        replacement_count = count if replace_all else 1
 
-        replacement = (
-            text.replace(resolved_old, new)
-            if args.get("all")
-            else text.replace(resolved_old, new, 1)
-        )
-        replacement_count = count if args.get("all") else 1
-
-    if replacement == text:
+    # replacement only differs from text where resolved_old was swapped for
+    # new, so comparing those two avoids a full-length comparison.
+    if new == resolved_old:
         return f"error: no change - old and new produce identical result in {basename}."
 
-    real_n = _NOOP_COUNTS[path].get("edit_real", 0) + 1
-
-    # Syntax guard: reject edits that would break valid JS/TS files
+    # Syntax guard: reject edits that would break valid JS/TS files.
+    # The pre-edit parse is skipped when we wrote the text after it passed.
+    replacement_bytes = replacement.encode("utf-8")
+    syntax_checked = False
     if path.endswith((".js", ".mjs", ".ts")):
-        if _js_syntax_ok(text) and not _js_syntax_ok(replacement):
-            return (
-                f"error: edit rejected - your change would introduce a syntax error in {basename}. File NOT changed. "
-                f"Check your 'new' code for missing brackets, semicolons, or quotes, then retry."
-            )
-
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(replacement)
+        if _js_text_known_ok(path, text):
+            text_ok, replacement_ok = True, _js_syntax_ok(replacement_bytes)
+        else:
+            # Both parses go to the checker in a single round-trip.
+            text_ok, replacement_ok = _js_syntax_check(text, replacement_bytes)
+        if text_ok:
+            if not replacement_ok:
+                return (
+                    f"error: edit rejected - your change would introduce a syntax error in {basename}. File NOT changed. "
+                    f"Check your 'new' code for missing brackets, semicolons, or quotes, then retry."
+                )
+            syntax_checked = True
+
+    # Looked up before the entry below is replaced with the new content.
+    before_sha = _content_digest_for(path, text)
+    after_sha = _bytes_digest(replacement_bytes)
+    written_st = _write_bytes(path, replacement_bytes)
+    _remember_written(path, written_st, replacement, after_sha)
+    if syntax_checked:
+        _JS_SYNTAX_OK[path] = _stat_signature(written_st)
+    else:
+        _JS_SYNTAX_OK.pop(path, None)
 
-    _NOOP_COUNTS[path]["edit_real"] = real_n
-    _track_file_version(path, replacement)
-    if path in _NOOP_COUNTS:
-        _NOOP_COUNTS[path].pop("edit_noop", None)
+    counts.edit_real += 1
+    new_lines = replacement_bytes.count(b"\n")
+    _track_file_version(path, replacement, new_lines)
+    counts.edit_noop = 0
 
-    changed_lines = _changed_lines_est(text, replacement)
-    symbols = _changed_symbols(text, replacement)
+    diff = _diff_bundle(text, replacement)
+    changed_lines = diff["changed_lines"]
+    symbols = _changed_symbols(text, replacement, bundle=diff)
     mutation = _record_mutation(
         op="edit",
         path=path,
         changed=True,
-        before_sha=_content_digest(text),
-        after_sha=_content_digest(replacement),
+        before_sha=before_sha,
+        after_sha=after_sha,
         changed_lines_est=changed_lines,
         changed_symbols=symbols,
         noop_streak_for_file=0,
     )
-    decision_hint = _mutation_decision_hint(mutation)
-    state_brief = _mutation_brief_line(mutation)
-    state_line = _mutation_state_line(mutation)
-    summary = _change_summary(text, replacement)
+    summary = _change_summary(text, replacement, prev_sha=before_sha, new_sha=after_sha, bundle=diff)
 
     lines: List[str] = [
         f"ok: updated {display_path}. {replacement_count} replacement(s).",
     ]
 
     if _edit_success_snippet_enabled():
-        snippet = _build_edit_region_snippet(text, replacement)
+        snippet = _build_edit_region_snippet(text, replacement, bundle=diff)
         if snippet is not None:
             lines.append(
                 f"Showing lines {snippet['start_line']}-{snippet['end_line']} of {snippet['total_lines']}:"
@@ -1419,13 +1957,15 @@ def edit(args: Any) -> str:
 
     if _edit_verbose_state_enabled():
         file_state = (
-            f"file_state: lines={_content_line_count(replacement)} "
-            f"chars={len(replacement)} sha256={_content_digest(replacement)}"
+            f"file_state: lines={_content_line_count(replacement_bytes, new_lines)} "
+            f"chars={len(replacement)} sha256={after_sha}"
         )
         lines.append(file_state)
-        lines.append(decision_hint)
-        lines.append(state_brief)
-        lines.append(state_line)
+        # The state lines (state_json serialises the recent history) are
+        # only built for verbose output.
+        lines.append(_mutation_decision_hint(mutation))
+        lines.append(_mutation_brief_line(mutation))
+        lines.append(_mutation_state_line(mutation))
 
     lines.append("Action: if this satisfies requirements, call finish; otherwise make the next targeted edit.")
     return "\n".join(lines)